@@ -0,0 +1,3 @@
+'''
+Benchmarks of letsdo on synthetic histories, see suite.py
+'''
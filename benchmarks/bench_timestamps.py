@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Compare the history timestamp parser with str2datetime
+
+Usage:
+    python3 benchmarks/bench_timestamps.py [<rows>]
+'''
+import os
+import sys
+from datetime import datetime, timedelta
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from timetoolkit import parse_history_datetime, str2datetime  # noqa: E402
+
+
+def history_timestamps(rows):
+    '''Generate the start and end timestamps of rows history lines'''
+    time = datetime(2015, 1, 1, 8, 0)
+    for _ in range(rows):
+        yield time.strftime('%Y-%m-%d %H:%M')
+        time += timedelta(minutes=37)
+        yield time.strftime('%Y-%m-%d %H:%M')
+
+
+def measure(parser, timestamps):
+    '''Return the seconds spent parsing all timestamps'''
+    start = default_timer()
+    for timestamp in timestamps:
+        parser(timestamp)
+    return default_timer() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    timestamps = list(history_timestamps(rows))
+    assert all(parse_history_datetime(ts) == str2datetime(ts) for ts in timestamps[:1000])
+
+    slow = measure(str2datetime, timestamps)
+    fast = measure(parse_history_datetime, timestamps)
+    print('%d rows (%d timestamps)' % (rows, len(timestamps)))
+    print('str2datetime:           %6.2fs' % slow)
+    print('parse_history_datetime: %6.2fs' % fast)
+    print('speedup:                %6.1fx' % (slow / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Generate a synthetic letsdo-data history, run it with
+python3 -m benchmarks.generate
+
+Usage:
+    generate <rows> <file> [--years=<years>] [--seed=<seed>]
+
+options:
+    --years=<years>  Years the history spans, ending one hour ago [default: 5]
+    --seed=<seed>    Random seed, the same seed gives the same history [default: 0]
+'''
+import random
+from datetime import datetime, timedelta
+
+VERBS = ('fix', 'review', 'write', 'plan', 'refactor', 'test', 'deploy', 'read',
+         'discuss', 'document', 'debug', 'call')
+OBJECTS = ('login page', 'parser', 'release notes', 'backlog', 'CI pipeline',
+           'database schema', 'API client', 'budget', 'onboarding', 'report',
+           'bug tracker', 'slides', 'unit tests', 'dashboard', 'invoice')
+TAGS = ('+letsdo', '+website', '+infra', '+research', '+hiring', '+ops')
+CONTEXTS = ('@office', '@home', '@train', '@cafe')
+
+# Rows written in the legacy date,name,worked,start,stop format, the oldest
+LEGACY_RATIO = 0.25
+
+
+def task_names(rng, count=300):
+    '''Make count distinct task names, some with +tags and a @context'''
+    names = set()
+    while len(names) < count:
+        words = [rng.choice(VERBS), rng.choice(OBJECTS)]
+        words += rng.sample(TAGS, rng.choice((0, 0, 1, 1, 2)))
+        if rng.random() < 0.4:
+            words.append(rng.choice(CONTEXTS))
+        if rng.random() < 0.3:
+            words.append('#%d' % rng.randint(1, 999))
+        names.add(' '.join(words))
+    return sorted(names)
+
+
+def history_lines(rows, years=5, seed=0, end=None):
+    '''Generate rows history lines, oldest first, spanning years up to end.
+
+    Names repeat with a long tail distribution: a few tasks are worked on
+    every day, most only now and then. Each row gets a time slot of its own,
+    so the history is in time order.
+    '''
+    rng = random.Random(seed)
+    names = task_names(rng)
+    weights = [1.0 / rank for rank in range(1, len(names) + 1)]
+    rng.shuffle(names)
+
+    end = end or datetime.now().replace(second=0, microsecond=0) - timedelta(hours=1)
+    span = timedelta(days=365 * years)
+    slot = span / rows
+    slot_minutes = max(1, int(slot.total_seconds() // 60))
+    legacy = int(rows * LEGACY_RATIO)
+
+    for row, name in enumerate(rng.choices(names, weights, k=rows)):
+        start = end - span + slot * row
+        start = start.replace(second=0, microsecond=0)
+        worked = timedelta(minutes=rng.randint(1, max(1, slot_minutes * 4 // 5)))
+        stop = start + worked
+        fields = [stop.strftime('%Y-%m-%d'), name]
+        if row < legacy:
+            fields.append(str(worked)[:-3])
+        fields += [start.strftime('%Y-%m-%d %H:%M'), stop.strftime('%Y-%m-%d %H:%M')]
+        yield ','.join(fields) + '\n'
+
+
+def generate(path, rows, years=5, seed=0, end=None):
+    '''Write a history of rows lines in path'''
+    with open(path, 'w') as history:
+        history.writelines(history_lines(rows, years, seed, end))
+
+
+def main():
+    import docopt
+
+    args = docopt.docopt(__doc__)
+    generate(args['<file>'], int(args['<rows>']), int(args['--years']), int(args['--seed']))
+
+
+if __name__ == '__main__':
+    main()
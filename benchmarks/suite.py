@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+Time letsdo on synthetic histories
+
+Each size gets a history generated in a temporary home directory, which is
+used as HOME while the benchmarks run. Run it with python3 -m benchmarks.
+
+The name table is cleared before each benchmark, as in a new command, and
+its hits and misses over the runs are reported along with the times.
+
+Usage:
+    benchmarks [--rows=<rows>]... [--repeat=<repeat>] [--output=<file>]
+
+options:
+    --rows=<rows>      History sizes, in rows [default: 10000 100000 1000000]
+    --repeat=<repeat>  Runs of each benchmark, the first one is reported apart [default: 3]
+    --output=<file>    Write the JSON results in file instead of printing them
+'''
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+from timeit import default_timer
+
+from .generate import generate
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+# Queries of the report benchmarks, see all is run with no query
+QUERIES = ('today', 'this week')
+COMMANDS = (['see', 'today'], ['see', 'this', 'week'], ['see', 'all'])
+
+
+def version():
+    '''Get the letsdo version from setup.py'''
+    with open(os.path.join(ROOT, 'setup.py')) as setup:
+        match = re.search(r"__version__ = '([^']+)'", setup.read())
+    return match.group(1) if match else None
+
+
+def measure(function, repeat):
+    '''Run function repeat times, return the seconds of each run'''
+    times = []
+    for _ in range(repeat):
+        start = default_timer()
+        function()
+        times.append(default_timer() - start)
+    return times
+
+
+def summary(times):
+    '''First, best and median run of a benchmark'''
+    warm = sorted(times[1:] or times)
+    return {
+        'first': round(times[0], 6),
+        'min': round(warm[0], 6),
+        'median': round(warm[len(warm) // 2], 6),
+        'runs': len(times),
+    }
+
+
+def benchmarks():
+    '''Get the (name, function) benchmarks on the history in HOME'''
+    import letsdo
+    from query import compile_query
+
+    def quiet(function, *args, **kwargs):
+        def run():
+            with redirect_stdout(io.StringIO()):
+                function(*args, **kwargs)
+        return run
+
+    def main(argv):
+        def run():
+            sys.argv = ['lets'] + argv
+            letsdo.main()
+        return quiet(run)
+
+    # The first run of get_tasks also builds the history indexes
+    yield 'get_tasks', letsdo.get_tasks
+    tasks = letsdo.get_tasks()
+    groups = letsdo.group_task_by(tasks, 'name')
+    yield 'group_task_by', lambda: letsdo.group_task_by(tasks, 'name')
+    for query in QUERIES:
+        yield 'compile_query %s' % query, lambda query=query: compile_query(query)
+        plan = compile_query(query)
+        yield 'filter %s' % query, lambda plan=plan: [
+            task for task in tasks if plan.matches(task)]
+    yield 'report_task', quiet(letsdo.report_task, groups, title='all')
+    for argv in COMMANDS:
+        yield 'main %s' % ' '.join(argv), main(argv)
+
+
+def run(sizes, repeat):
+    '''Run the benchmarks on a history of each size, return their results'''
+    from history import NAMES
+
+    results = []
+    home = tempfile.mkdtemp(prefix='letsdo-bench-')
+    environ_home = os.environ.get('HOME')
+    os.environ['HOME'] = home
+    try:
+        with open(os.path.join(home, '.letsdo'), 'w') as configuration:
+            configuration.write('COLOR_ENABLED: false\nDATA_DIRECTORY: %s\n' % home)
+
+        for rows in sizes:
+            data = os.path.join(home, 'letsdo-data')
+            generate(data, rows)
+            for name, function in benchmarks():
+                result = {'benchmark': name, 'rows': rows}
+                NAMES.clear()
+                result.update(summary(measure(function, repeat)))
+                result['names'] = NAMES.counters()
+                print('%8d %-36s %10.4fs' % (rows, name, result['min']), file=sys.stderr)
+                results.append(result)
+    finally:
+        if environ_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = environ_home
+        shutil.rmtree(home)
+    return results
+
+
+def main():
+    import docopt
+
+    args = docopt.docopt(__doc__)
+    sizes = [int(rows) for value in args['--rows'] for rows in value.split()]
+    report = {
+        'version': version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'results': run(sizes, max(1, int(args['--repeat']))),
+    }
+
+    if args['--output']:
+        with open(args['--output'], 'w') as output:
+            json.dump(report, output, indent=2)
+            output.write('\n')
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
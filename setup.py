@@ -39,7 +39,7 @@ setup(name='letsdo',
       long_description=long_description(),
       package_dir={'': 'src'},
       packages=find_packages('src'),
-      py_modules=['letsdo', 'log', 'configuration', 'timetoolkit'],
+      py_modules=['letsdo', 'log', 'configuration', 'timetoolkit', 'history', 'aggregate', 'storage', 'table', 'query', 'timesheet', 'parallel', 'record'],
       url='https://github.com/clobrano/letsdo',
       version=__version__,
       classifiers=[
@@ -0,0 +1,94 @@
+'''
+Single pass aggregation of tasks
+'''
+from collections import OrderedDict
+from datetime import timedelta
+
+
+def _week(task):
+    return [task.end_time.strftime('%G-W%V') if task.end_time else None]
+
+
+def _month(task):
+    return [task.end_time.strftime('%Y-%m') if task.end_time else None]
+
+
+# Functions returning the values a task is grouped under for each key.
+# A task with many tags is counted once for each of them.
+GROUP_KEYS = {
+    'name': lambda task: [task.name],
+    'date': lambda task: [task.last_end_date],
+    'week': _week,
+    'month': _month,
+    'tag': lambda task: task.tags or [None],
+    'context': lambda task: [task.context],
+}
+
+
+class Aggregate(object):
+    '''Totals of a group of tasks.
+
+    It can be reported like a Task: name, tid, start and end time are the
+    ones of the first task added to the group, that is the most recent one
+    when tasks come from get_tasks.
+    '''
+    def __init__(self, key, task):
+        self.key = key
+        self.name = task.name
+        self.tid = task.tid
+        self.start_time = task.start_time
+        self.end_time = task.end_time
+        self.work_time = timedelta()
+        self.count = 0
+        self.first_seen = task.start_time
+        self.last_seen = task.end_time
+
+    @property
+    def last_end_date(self):
+        """ The last day when this group was active"""
+        if self.end_time:
+            return self.end_time.strftime("%Y-%m-%d")
+        return None
+
+    def add(self, task):
+        '''Add task to the group totals'''
+        # Times of history records are computed on each read, read them once
+        start_time, end_time = task.start_time, task.end_time
+        self.work_time += task.work_time
+        self.count += 1
+        if start_time and (not self.first_seen or start_time < self.first_seen):
+            self.first_seen = start_time
+        if end_time and (not self.last_seen or end_time > self.last_seen):
+            self.last_seen = end_time
+
+    def merge(self, other):
+        '''Add the totals of other, a group of older tasks with the same key'''
+        self.work_time += other.work_time
+        self.count += other.count
+        if other.first_seen and (not self.first_seen or other.first_seen < self.first_seen):
+            self.first_seen = other.first_seen
+        if other.last_seen and (not self.last_seen or other.last_seen > self.last_seen):
+            self.last_seen = other.last_seen
+
+    def __repr__(self):
+        return "%s: %d tasks, %s" % (self.key, self.count, self.work_time)
+
+
+def aggregate(tasks, keys=('name',)):
+    '''Group tasks by the combination of the given keys (see GROUP_KEYS).
+
+    Returns an OrderedDict from tuples of key values to Aggregate, in order of
+    first appearance in tasks.
+    '''
+    key_functions = [GROUP_KEYS[key] for key in keys]
+    groups = OrderedDict()
+    for task in tasks:
+        group_keys = [()]
+        for function in key_functions:
+            group_keys = [key + (value,) for key in group_keys for value in function(task)]
+        for key in group_keys:
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = Aggregate(key, task)
+            group.add(task)
+    return groups
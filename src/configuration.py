@@ -2,8 +2,44 @@
 This module keeps the classes and function that manage user customization
 '''
 import os
-import yaml
-from log import info, LOGGER
+import re
+from log import info, timed, LOGGER
+
+# A "KEY: value" line of a flat configuration file, as Configuration saves it
+_FLAT_LINE = re.compile(r'^([A-Z_]+): (\S+)$')
+# Values yaml reads as strings: paths, and words that are not yaml keywords
+_FLAT_STRING = re.compile(r'^(?:~?/[\w/.~\-]*|[A-Za-z][\w.\-]*)$')
+_FLAT_KEYWORDS = {
+    'y', 'Y', 'yes', 'Yes', 'YES', 'n', 'N', 'no', 'No', 'NO',
+    'on', 'On', 'ON', 'off', 'Off', 'OFF', 'null', 'Null', 'NULL',
+}
+_FLAT_BOOLEANS = {
+    'true': True, 'True': True, 'TRUE': True,
+    'false': False, 'False': False, 'FALSE': False,
+}
+
+
+def load_flat(text):
+    '''Parse a flat "KEY: value" configuration the way yaml.safe_load does.
+
+    Importing yaml costs more than the rest of a command, so the usual
+    configuration file is parsed here. Returns None for anything else
+    (comments, quotes, numbers, nested values...), which is left to yaml.
+    '''
+    configuration = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = _FLAT_LINE.match(line)
+        if not match:
+            return None
+        key, value = match.groups()
+        if value in _FLAT_BOOLEANS:
+            value = _FLAT_BOOLEANS[value]
+        elif value in _FLAT_KEYWORDS or not _FLAT_STRING.match(value):
+            return None
+        configuration[key] = value
+    return configuration
 
 
 class Configuration(object):
@@ -11,15 +47,36 @@ class Configuration(object):
     def __init__(self):
         self._data_directory = os.path.expanduser('~')
         self._color_enabled = True
+        self._storage = 'csv'
+        self._signature = None
 
         self.conf_file_path = os.path.join(os.path.expanduser('~'), '.letsdo')
         if not os.path.exists(self.conf_file_path):
             LOGGER.debug('creating config file "%s".', self.conf_file_path)
             self.__save()
 
-        self.configuration = yaml.safe_load(open(self.conf_file_path).read())
-        self.data_directory = os.path.expanduser(self.__get_value('DATA_DIRECTORY', None))
-        self.color_enabled = self.__get_value('COLOR_ENABLED', False)
+        self.__load()
+
+    @timed('config')
+    def __load(self):
+        self._signature = self.__get_signature()
+        with open(self.conf_file_path) as cfile:
+            text = cfile.read()
+        self.configuration = load_flat(text)
+        if self.configuration is None:
+            import yaml
+
+            self.configuration = yaml.safe_load(text) or {}
+
+        # Values read from disk are not written back, setters are meant for
+        # user changes only.
+        directory = self.__get_value('DATA_DIRECTORY', None)
+        if directory and os.path.exists(os.path.expanduser(directory)):
+            self._data_directory = os.path.expanduser(directory)
+        else:
+            LOGGER.error('directory "%s" does not exists', directory)
+        self._color_enabled = self.__get_value('COLOR_ENABLED', False)
+        self._storage = self.__get_value('STORAGE', 'csv')
 
         if not self.data_directory or not os.path.exists(self.data_directory):
             LOGGER.fatal("could not save task data in %s", self.data_directory)
@@ -27,6 +84,21 @@ class Configuration(object):
             self.data_fullpath = os.path.join(self.data_directory, 'letsdo-data')
             self.task_fullpath = os.path.join(self.data_directory, 'letsdo-task')
 
+    def __get_signature(self):
+        try:
+            stat = os.stat(self.conf_file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload_if_changed(self):
+        '''Reload the configuration if the file changed on disk'''
+        if self.__get_signature() != self._signature:
+            LOGGER.debug('config file "%s" changed, reloading', self.conf_file_path)
+            if not os.path.exists(self.conf_file_path):
+                self.__save()
+            self.__load()
+
     def __get_value(self, key, default):
         try:
             value = self.configuration[key]
@@ -37,9 +109,13 @@ class Configuration(object):
         return value
 
     def __save(self):
-        data = {"COLOR_ENABLED": self.color_enabled, "DATA_DIRECTORY": self.data_directory}
+        data = {"COLOR_ENABLED": self.color_enabled, "DATA_DIRECTORY": self.data_directory,
+                "STORAGE": self.storage}
+        import yaml
+
         with open(self.conf_file_path, 'w') as cfile:
             yaml.dump(data, cfile, default_flow_style=False)
+        self._signature = self.__get_signature()
 
     @property
     def data_directory(self):
@@ -52,7 +128,12 @@ class Configuration(object):
             LOGGER.error('directory "%s" does not exists', directory)
             return
 
+        if directory == self._data_directory:
+            return
+
         self._data_directory = directory
+        self.data_fullpath = os.path.join(self.data_directory, 'letsdo-data')
+        self.task_fullpath = os.path.join(self.data_directory, 'letsdo-task')
         self.__save()
 
     @property
@@ -61,13 +142,46 @@ class Configuration(object):
 
     @color_enabled.setter
     def color_enabled(self, enabled):
+        if enabled == self._color_enabled:
+            return
+
         self._color_enabled = enabled
         self.__save()
 
+    @property
+    def storage(self):
+        '''returns the history storage name (csv, sqlite or segments)'''
+        return self._storage
+
+    @storage.setter
+    def storage(self, storage):
+        if storage == self._storage:
+            return
+
+        self._storage = storage
+        self.__save()
+
     def __repr__(self):
         return "DATA_DIRECTORY: %s\n" % (self.data_directory)
 
 
+_CONFIGURATION = None
+
+
+def get_configuration():
+    '''Returns the process-wide Configuration.
+
+    The configuration file is parsed once per process and parsed again only
+    when its modification time or size change.
+    '''
+    global _CONFIGURATION
+    if _CONFIGURATION is None:
+        _CONFIGURATION = Configuration()
+    else:
+        _CONFIGURATION.reload_if_changed()
+    return _CONFIGURATION
+
+
 def autocomplete():
     '''Setup autocomplete'''
     message = '''
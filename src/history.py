@@ -0,0 +1,827 @@
+'''
+Low level access to the tasks' history file
+'''
+import io
+import mmap
+import os
+import re
+import sys
+from bisect import bisect_left
+from operator import itemgetter
+from log import LOGGER, counters
+from timetoolkit import parse_history_datetime
+
+BLOCK_SIZE = 64 * 1024
+
+# Contexts (@) and projects (+) words in a task name
+TAGS_PATTERN = re.compile(r"[@\+][\w\-_]+")
+
+# Advice releasing the mapped pages of scanned history, where supported
+DROP_PAGES = getattr(mmap, 'MADV_DONTNEED', None)
+
+# Modules opening compressed history files, by suffix, imported when an
+# archive is read
+ARCHIVES = {'.xz': 'lzma', '.gz': 'gzip'}
+
+
+# Contexts (@) and projects (+) of a task name, apart
+CONTEXT_PATTERN = re.compile(r"@[\w\-_]+")
+TAG_PATTERN = re.compile(r"\+[\w\-_]+")
+
+# Prefixes and Markdown removed by sanitize
+_LIST_SYMBOL = re.compile(r"^[\-\*]")
+_LONG_DATE = re.compile(r"^\s*\d+-\d+-\d+\s+")
+_SHORT_DATE = re.compile(r"^\s*\d+/\d+\s+")
+_MD_LINK = re.compile(r"\[(.*)\]\(.*\)")
+
+# Distinct names kept by the name table, it is cleared when full
+MAX_NAMES = 65536
+
+
+def sanitize(text):
+    """Remove symbols, dates and Markdown syntax from text"""
+    # remove initial list symbol (if any)
+    if _LIST_SYMBOL.match(text):
+        text = _LIST_SYMBOL.sub("", text)
+
+    # remove initial date (yyyy-mm-dd)
+    if _LONG_DATE.match(text):
+        text = _LONG_DATE.sub("", text)
+
+    # remove initial date (yy\date-of-year)
+    if _SHORT_DATE.match(text):
+        text = _SHORT_DATE.sub("", text)
+
+    # remove markdown links
+    has_link = _MD_LINK.search(text)
+    if has_link:
+        link_name = _MD_LINK.findall(text)
+        text = _MD_LINK.sub(link_name[0], text)
+
+    return text
+
+
+class NameInfo(object):
+    """What a task name tells: the name as stored, its single @context (or
+    None), its +tags (or None) and its uid, hashed on first use"""
+    __slots__ = ('name', 'context', 'tags', '__uid')
+
+    def __init__(self, name):
+        # Commas separate the fields of history lines
+        self.name = sys.intern(name.strip().replace(",", " "))
+        matches = CONTEXT_PATTERN.findall(self.name)
+        self.context = matches[0] if len(matches) == 1 else None
+        self.tags = TAG_PATTERN.findall(self.name) or None
+        self.__uid = None
+
+    @property
+    def uid(self):
+        if self.__uid is None:
+            self.__uid = task_uid(self.name)
+        return self.__uid
+
+    def __repr__(self):
+        return "NameInfo(%r)" % self.name
+
+
+class NameTable(object):
+    """The NameInfo of the sanitized form of each raw name found in history,
+    so that each distinct name is sanitized, parsed and hashed once.
+
+    hits and misses count the lookups answered from the table and the ones
+    that had to process a name.
+    """
+
+    def __init__(self, size=MAX_NAMES):
+        self.size = size
+        self.infos = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, raw):
+        """Get the NameInfo of the sanitized form of raw"""
+        info = self.infos.get(raw)
+        if info is not None:
+            self.hits += 1
+            return info
+        self.misses += 1
+        if len(self.infos) >= self.size:
+            self.infos.clear()
+        info = self.infos[raw] = NameInfo(sanitize(raw))
+        return info
+
+    def clear(self):
+        """Forget the names and reset the counters"""
+        self.infos.clear()
+        self.hits = self.misses = 0
+
+    def counters(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+# The name table of the process
+NAMES = NameTable()
+name_info = NAMES.lookup
+counters('names', NAMES.counters)
+
+
+def parse_history_line(line):
+    """Get name, start and end strings from a history line
+
+    Returns None if the line has no task name.
+    """
+    fields = line.strip().split(",")
+    if not fields[1]:
+        return None
+
+    # Take care of old history format with worked_time
+    if len(fields) == 5:
+        return fields[1], fields[3], fields[4]
+    if len(fields) == 4:
+        return fields[1], fields[2], fields[3]
+    raise Exception("History unexpected fields ({}: {})".format(len(fields), fields))
+
+
+def task_uid(name):
+    """Get the unique ID shared by all the tasks with the given name"""
+    # hashlib loads OpenSSL, which is slow, and most commands hash nothing
+    import hashlib
+
+    gen = hashlib.sha256(name.encode())
+    return gen.hexdigest()
+
+
+def line_name(line):
+    """Get the sanitized task name of a history line (bytes), or None"""
+    fields = parse_history_line(line.decode())
+    if not fields:
+        return None
+    return name_info(fields[0]).name
+
+
+def line_work(line):
+    """Get the sanitized task name, the start and end time strings (in the
+    stored format) and the seconds worked of a history line (bytes), or None
+    if it has no task name"""
+    fields = parse_history_line(line.decode())
+    if not fields:
+        return None
+    start, stop = [parse_history_datetime(time.strip()) for time in fields[1:]]
+    return (
+        name_info(fields[0]).name,
+        start.strftime('%Y-%m-%d %H:%M'),
+        stop.strftime('%Y-%m-%d %H:%M'),
+        int((stop - start).total_seconds()),
+    )
+
+
+def signature(path):
+    '''Return a tuple identifying the current content of the file at path,
+    or None if the file does not exist'''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def is_archive(path):
+    '''Check whether the history file at path is compressed'''
+    return os.path.splitext(path)[1] in ARCHIVES
+
+
+class ArchiveError(IOError):
+    '''A history archive could not be decompressed'''
+
+
+class _Archive(io.RawIOBase):
+    # Decompressed bytes of a history archive, with the errors of its
+    # module raised as ArchiveError
+    def __init__(self, path):
+        from importlib import import_module
+
+        name = ARCHIVES[os.path.splitext(path)[1]]
+        if name == 'lzma':
+            module = import_module(name)
+            self.errors = (module.LZMAError,)
+        else:
+            import zlib
+
+            module = import_module(name)
+            self.errors = (zlib.error,)
+        self.path = path
+        self.file = module.open(path, 'rb')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        try:
+            data = self.file.read(len(buffer))
+        except self.errors as error:
+            raise ArchiveError('%s: %s' % (self.path, error))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        try:
+            return self.file.seek(offset, whence)
+        except self.errors as error:
+            raise ArchiveError('%s: %s' % (self.path, error))
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+        super(_Archive, self).close()
+
+
+def open_history(path):
+    '''Open the history file at path for reading bytes, decompressing it on
+    the fly if it is an archive'''
+    if is_archive(path):
+        return io.BufferedReader(_Archive(path), BLOCK_SIZE)
+    return open(path, 'rb')
+
+
+def _may_match(text, needles):
+    # Whether the history lines in text can hold all the needles once
+    # sanitized, Markdown links are cut off names and can join words
+    return all(needle in text for needle in needles) or b'](' in text
+
+
+def _spill(cfile, start, end, target, block_size, needles):
+    # Copy the lines between the start and end offsets of cfile to target,
+    # reading forwards in blocks and leaving out the ones without needles
+    cfile.seek(start)
+    left = None if end is None else end - start
+    rest = b''
+    while True:
+        size = block_size if left is None else min(block_size, left)
+        data = cfile.read(size) if size else b''
+        if data:
+            if left is not None:
+                left -= len(data)
+            block = rest + data
+            cut = block.rfind(b'\n') + 1
+            block, rest = block[:cut], block[cut:]
+        else:
+            # The last line may have no end of line
+            block = rest + b'\n' if rest else b''
+        if block and (not needles or _may_match(block, needles)):
+            if needles:
+                block = b''.join(
+                    line for line in block.splitlines(True) if _may_match(line, needles))
+            target.write(block)
+        if not data:
+            return
+
+
+def reverse_lines(path, start=0, end=None, block_size=BLOCK_SIZE, needles=()):
+    '''Yield the non empty lines of the file at path, newest (last) first.
+
+    Only the bytes between the start and end offsets are considered, both
+    must be at line boundaries. The file is memory mapped and scanned
+    backwards in blocks of about block_size bytes cut at line boundaries,
+    so only the lines actually consumed by the caller are read from disk.
+    Lines without all the needles (bytes) are skipped before being decoded,
+    as are whole blocks without them.
+
+    Archives can only be decompressed forwards: the lines between start and
+    end are decompressed in blocks to a temporary file next to the archive,
+    which is then scanned backwards as well.
+    '''
+    if is_archive(path):
+        # It imports random and shutil, plain files do not need it
+        import tempfile
+
+        with open_history(path) as cfile, \
+                tempfile.TemporaryFile(dir=os.path.dirname(path)) as plain:
+            _spill(cfile, start, end, plain, block_size, needles)
+            plain.flush()
+            for line in _reverse_mapped(plain, 0, None, block_size, ()):
+                yield line
+        return
+
+    with open(path, 'rb') as cfile:
+        for line in _reverse_mapped(cfile, start, end, block_size, needles):
+            yield line
+
+
+def _reverse_mapped(cfile, start, end, block_size, needles):
+    # The lines reverse_lines yields, from the open plain file cfile
+    size = os.fstat(cfile.fileno()).st_size
+    end = size if end is None else min(end, size)
+    if end <= start:
+        return
+    with mmap.mmap(cfile.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        while end > start:
+            position = max(start, end - block_size)
+            if position > start:
+                position = buffer.rfind(b'\n', start, position) + 1 or start
+            block = buffer[position:end]
+            if DROP_PAGES is not None:
+                # Scanned pages are not read again, keep the memory
+                # flat: reading a block can map the pages of the
+                # previous one again
+                page = position - position % mmap.PAGESIZE
+                buffer.madvise(DROP_PAGES, page, min(size, end + block_size) - page)
+            end = position
+            if needles and not _may_match(block, needles):
+                continue
+            for line in reversed(block.split(b'\n')):
+                if line.strip() and (not needles or _may_match(line, needles)):
+                    yield line.decode()
+
+
+def reverse_fields(path, start=0, end=None, needles=()):
+    '''Yield the (name, start, stop) strings of the history lines found by
+    reverse_lines, newest first, skipping the invalid ones'''
+    for line in reverse_lines(path, start=start, end=end, needles=needles):
+        fields = parse_history_line(line)
+        if fields:
+            yield fields
+
+
+def line_day(line):
+    '''Return the day (YYYY-MM-DD) a history line ended on, or None'''
+    day = line.rsplit(b',', 1)[-1].strip()[:10]
+    if len(day) == 10 and day[4:5] == b'-' and day[7:8] == b'-':
+        return day.decode()
+    return None
+
+
+class HistoryIndex(object):
+    '''Base class of the sidecar files indexing the history file.
+
+    An index stores the signature of the history file it describes, it is
+    rebuilt whenever the history changes behind its back. Subclasses define
+    the file SUFFIX and how lines are added, parsed and dumped.
+    '''
+    SUFFIX = None
+
+    def __init__(self, data_path):
+        self.data_path = data_path
+        self.path = data_path + self.SUFFIX
+        self.signature = None
+        self.clear()
+
+    @classmethod
+    def load(cls, data_path):
+        '''Get the index of data_path, rebuilding it if it is out of date'''
+        index = cls(data_path)
+        if not index.read() or index.signature != signature(data_path):
+            LOGGER.debug('rebuilding history index "%s"', index.path)
+            index.rebuild()
+        return index
+
+    @classmethod
+    def update(cls, data_path, before, offset, lines):
+        '''Record the lines (text) appended at offset to data_path, whose
+        signature was before prior to the append'''
+        index = cls(data_path)
+        if not index.read() or index.signature != before:
+            # Out of date already, it will be rebuilt on next load
+            return
+        for line in lines.splitlines(True):
+            line = line.encode()
+            index.add(line, offset)
+            offset += len(line)
+        index.signature = signature(data_path)
+        index.write()
+
+    def rebuild(self):
+        '''Scan the whole history file to build the index'''
+        self.clear()
+        self.signature = signature(self.data_path)
+        offset = 0
+        with open_history(self.data_path) as cfile:
+            for line in cfile:
+                self.add(line, offset)
+                offset += len(line)
+        self.write()
+
+    def move(self, data_path):
+        '''Save the index as the one of data_path, holding the same lines'''
+        self.data_path = data_path
+        self.path = data_path + self.SUFFIX
+        self.signature = signature(data_path)
+        self.write()
+
+    def read(self):
+        '''Read the index file, returns False if it is missing or corrupted'''
+        try:
+            with open(self.path) as cfile:
+                header = cfile.readline().strip().split(',')
+                self.signature = tuple(int(value) for value in header)
+                self.parse(cfile)
+        except (IOError, ValueError) as error:
+            LOGGER.debug('could not read history index: %s', error)
+            self.clear()
+            return False
+        return True
+
+    def write(self):
+        '''Save the index file'''
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as cfile:
+                cfile.write('%d,%d,%d\n' % self.signature)
+                cfile.writelines(self.dump())
+            os.replace(temp_path, self.path)
+        except IOError as error:
+            LOGGER.warning('could not save history index: %s', error)
+
+    def clear(self):
+        '''Empty the index'''
+        raise NotImplementedError
+
+    def add(self, line, offset):
+        '''Index the history line (bytes) found at offset'''
+        raise NotImplementedError
+
+    def parse(self, cfile):
+        '''Load the index body from the open index file'''
+        raise NotImplementedError
+
+    def dump(self):
+        '''Get the lines of the index body'''
+        raise NotImplementedError
+
+
+class DayIndex(HistoryIndex):
+    '''Sidecar index mapping each day of the history to the byte offset of
+    its first line.
+
+    History lines are appended in time order, so all the lines of a day are
+    found between its offset and the offset of the following day. Lines out
+    of time order, as appended by backfilled tasks, stay in the range of the
+    day they were appended in and are listed apart with their own day.
+    '''
+    SUFFIX = '.idx'
+
+    def clear(self):
+        self.days = []
+        self.offsets = []
+        # (day, start, end) of the lines older than the day they follow
+        self.late = []
+        # Bytes of history, archives are larger than their file
+        self.size = 0
+
+    def add(self, line, offset):
+        day = line_day(line)
+        if day and (not self.days or day > self.days[-1]):
+            self.days.append(day)
+            self.offsets.append(offset)
+        elif day and day < self.days[-1]:
+            self.late.append((day, offset, offset + len(line)))
+        self.size = offset + len(line)
+
+    def parse(self, cfile):
+        self.size, late = [int(value) for value in cfile.readline().split(',')]
+        for line in cfile:
+            if late:
+                day, start, end = line.split(',')
+                self.late.append((day, int(start), int(end)))
+                late -= 1
+                continue
+            day, offset = line.split(',')
+            self.days.append(day)
+            self.offsets.append(int(offset))
+
+    def dump(self):
+        yield '%d,%d\n' % (self.size, len(self.late))
+        for entry in self.late:
+            yield '%s,%d,%d\n' % entry
+        for entry in zip(self.days, self.offsets):
+            yield '%s,%d\n' % entry
+
+    def offset(self, day):
+        '''Get the offset of the first line ended on day or later'''
+        position = bisect_left(self.days, day.strftime('%Y-%m-%d'))
+        if position < len(self.offsets):
+            return self.offsets[position]
+        return self.size
+
+    def ranges(self, days):
+        '''Get the sorted (start, end) offset ranges holding the lines of the
+        given indexed days'''
+        ranges = []
+        for day in sorted(days):
+            position = bisect_left(self.days, day)
+            if position == len(self.days) or self.days[position] != day:
+                continue
+            start = self.offsets[position]
+            if position + 1 < len(self.offsets):
+                end = self.offsets[position + 1]
+            else:
+                end = self.size
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    def late_ranges(self, since=None, until=None):
+        '''Get the (start, end) offset ranges of the lines out of time order
+        ended in [since, until), which are not in the range of their day'''
+        since = since.strftime('%Y-%m-%d') if since else ''
+        until = until.strftime('%Y-%m-%d') if until else None
+        return [
+            (start, end) for day, start, end in self.late
+            if day >= since and (until is None or day < until)
+        ]
+
+
+class TagIndex(HistoryIndex):
+    '''Sidecar inverted index mapping each +tag and @context to the days
+    (as DayIndex buckets) it was used in'''
+    SUFFIX = '.tags'
+
+    def clear(self):
+        self.last_day = ''
+        self.tags = {}
+
+    def add(self, line, offset):
+        day = line_day(line)
+        if day and day > self.last_day:
+            self.last_day = day
+        if not self.last_day:
+            return
+        name = line_name(line)
+        if not name:
+            return
+        for tag in set(TAGS_PATTERN.findall(name)):
+            days = self.tags.setdefault(tag, [])
+            if not days or days[-1] != self.last_day:
+                days.append(self.last_day)
+
+    def parse(self, cfile):
+        self.last_day = cfile.readline().strip()
+        for line in cfile:
+            tag, days = line.split(',')
+            self.tags[tag] = days.split()
+
+    def dump(self):
+        yield '%s\n' % self.last_day
+        for tag, days in self.tags.items():
+            yield '%s,%s\n' % (tag, ' '.join(days))
+
+    def days(self, prefix):
+        '''Get the days with a tag or context starting by prefix'''
+        days = set()
+        for tag, tag_days in self.tags.items():
+            if tag.startswith(prefix):
+                days.update(tag_days)
+        return days
+
+
+class Vocabulary(HistoryIndex):
+    '''Sidecar file with the words used to complete the command line: the
+    +tags, @contexts and the most recent task names, each with its usage count
+    and the offset of its last use'''
+    SUFFIX = '.vocab'
+    MAX_NAMES = 500
+
+    def clear(self):
+        self.tags = {}
+        self.names = {}
+
+    def add(self, line, offset):
+        name = line_name(line)
+        if not name:
+            return
+        self.__use(self.names, name, offset)
+        for tag in set(TAGS_PATTERN.findall(name)):
+            self.__use(self.tags, tag, offset)
+
+    def parse(self, cfile):
+        for line in cfile:
+            kind, count, offset, word = line.rstrip('\n').split(',', 3)
+            words = self.tags if kind == 't' else self.names
+            words[word] = (int(count), int(offset))
+
+    def dump(self):
+        for kind, words in (('t', self.tags), ('n', self.names)):
+            for word in self.__ranked(words, self.MAX_NAMES if kind == 'n' else None):
+                count, offset = words[word]
+                yield '%s,%d,%d,%s\n' % (kind, count, offset, word)
+
+    @staticmethod
+    def __use(words, word, offset):
+        count = words[word][0] if word in words else 0
+        words[word] = (count + 1, offset)
+
+    @staticmethod
+    def __ranked(words, limit=None):
+        ranked = sorted(words, key=lambda word: words[word][::-1], reverse=True)
+        return ranked[:limit] if limit else ranked
+
+    def complete(self, prefix):
+        '''Get the words starting by prefix, most recently used first.
+        Words starting by + or @ are looked up in tags and contexts, anything
+        else in task names'''
+        words = self.tags if prefix[:1] in ('+', '@') else self.names
+        return [word for word in self.__ranked(words) if word.startswith(prefix)]
+
+
+class TaskTable(HistoryIndex):
+    '''Sidecar table of the task IDs: the uid of each task name, with the
+    offset and the name as found in history of its last use.
+
+    Task IDs are the positions of the uids in the table, most recently used
+    first, so a task is found by its ID without reading the history.
+    '''
+    SUFFIX = '.tids'
+
+    def clear(self):
+        self.tasks = {}
+
+    def add(self, line, offset):
+        fields = parse_history_line(line.decode())
+        if not fields:
+            return
+        self.tasks[name_info(fields[0]).uid] = (offset, fields[0])
+
+    def parse(self, cfile):
+        for line in cfile:
+            uid, offset, name = line.rstrip('\n').split(',', 2)
+            self.tasks[uid] = (int(offset), name)
+
+    def dump(self):
+        for uid in self.ranked():
+            yield '%s,%d,%s\n' % ((uid,) + self.tasks[uid])
+
+    def ranked(self):
+        '''Get the uids, most recently used first'''
+        return sorted(self.tasks, key=lambda uid: self.tasks[uid][0], reverse=True)
+
+    def name(self, tid):
+        '''Get the name of the task with ID tid as found in history, or None'''
+        ranked = self.ranked()
+        if 0 < tid <= len(ranked):
+            return self.tasks[ranked[tid - 1]][1]
+        return None
+
+    def ids(self):
+        '''Get (tid, name as found in history) by sanitized task name'''
+        return {
+            name_info(self.tasks[uid][1]).name: (tid, self.tasks[uid][1])
+            for tid, uid in enumerate(self.ranked(), 1)
+        }
+
+
+class DailyRollup(HistoryIndex):
+    '''Sidecar file with the work time and the number of tasks of each task
+    name (that is, each task uid) on each day, along with the start and end
+    time of its last task of the day.
+
+    Totals over weeks, months or years are summed from a few lines per day
+    instead of parsing every history line. Lines read from the file are only
+    split when a day in the requested range needs them, and the lines added
+    since the last rebuild are summed up when queried.
+    '''
+    SUFFIX = '.rollup'
+
+    def clear(self):
+        # (day, name) to [seconds, count, offset, start, stop], as added
+        self.days = {}
+        # Day lines as read from the file
+        self.lines = []
+
+    def add(self, line, offset):
+        work = line_work(line)
+        if not work:
+            return
+        name, start, stop, seconds = work
+        entry = self.days.get((stop[:10], name))
+        if entry is None:
+            self.days[(stop[:10], name)] = [seconds, 1, offset, start, stop]
+        else:
+            entry[:] = [entry[0] + seconds, entry[1] + 1, offset, start, stop]
+
+    def parse(self, cfile):
+        self.lines = cfile.readlines()
+        if self.lines and not self.lines[0].startswith('d,'):
+            raise ValueError('unexpected rollup line: %s' % self.lines[0])
+
+    def dump(self):
+        for line in self.lines:
+            yield line
+        for (day, name), entry in self.days.items():
+            yield 'd,%s,%d,%d,%d,%s,%s,%s\n' % ((day,) + tuple(entry) + (name,))
+
+    def __entries(self, since, until):
+        # (day, name, seconds, offset, start, stop) of the days in [since, until)
+        for line in self.lines:
+            day = line[2:12]
+            if (since and day < since) or (until and day >= until):
+                continue
+            day, seconds, _, offset, start, stop, name = line[2:].rstrip('\n').split(',', 6)
+            yield day, name, int(seconds), int(offset), start, stop
+        for (day, name), (seconds, _, offset, start, stop) in self.days.items():
+            if (since and day < since) or (until and day >= until):
+                continue
+            yield day, name, seconds, offset, start, stop
+
+    def totals(self, ids, since=None, until=None, tag=None, text=None, daily=False):
+        '''Get (tid, name, start, stop, seconds) for each task name ended on
+        the days in [since, until), with a +tag/@context starting by tag and
+        with text in its name or end day, or for each task name and day if
+        daily, most recently used first.
+
+        ids are the task IDs and history names, as returned by TaskTable.ids.
+        since and until are YYYY-MM-DD strings, start and stop are the times
+        of the last use.
+        '''
+        tagged = {}
+        groups = {}
+        for day, name, seconds, offset, start, stop in self.__entries(since, until):
+            if text and text not in day and text not in name:
+                continue
+            if tag:
+                if name not in tagged:
+                    tagged[name] = any(
+                        word.startswith(tag) for word in TAGS_PATTERN.findall(name))
+                if not tagged[name]:
+                    continue
+            key = (day, name) if daily else name
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [offset, name, start, stop, seconds]
+            elif offset > group[0]:
+                group[:] = [offset, name, start, stop, group[4] + seconds]
+            else:
+                group[4] += seconds
+        return [ids[name] + (start, stop, seconds)
+                for _, name, start, stop, seconds
+                in sorted(groups.values(), key=itemgetter(0), reverse=True)]
+
+
+class Seal(HistoryIndex):
+    '''Sidecar summary of a closed history file: its number of tasks, the
+    start time of the first one and the end time of the last one, the work
+    time of each +tag/@context and the totals of each task name.
+
+    It is a few lines long whatever the size of the file, and it is built
+    again if the file changes, as any other index.
+    '''
+    SUFFIX = '.seal'
+
+    def clear(self):
+        self.count = 0
+        self.first = ''
+        self.last = ''
+        self.tags = {}
+        # Name to [seconds, count, offset, start, stop] of its last use
+        self.tasks = {}
+
+    def add(self, line, offset):
+        work = line_work(line)
+        if not work:
+            return
+        name, start, stop, seconds = work
+        self.count += 1
+        self.first = min(self.first or start, start)
+        self.last = max(self.last, stop)
+        for tag in set(TAGS_PATTERN.findall(name)):
+            self.tags[tag] = self.tags.get(tag, 0) + seconds
+        entry = self.tasks.get(name)
+        if entry is None:
+            self.tasks[name] = [seconds, 1, offset, start, stop]
+        else:
+            entry[:] = [entry[0] + seconds, entry[1] + 1, offset, start, stop]
+
+    def parse(self, cfile):
+        count, self.first, self.last = cfile.readline().rstrip('\n').split(',')
+        self.count = int(count)
+        for line in cfile:
+            kind, line = line.rstrip('\n').split(',', 1)
+            if kind == 't':
+                seconds, tag = line.split(',')
+                self.tags[tag] = int(seconds)
+            else:
+                seconds, count, offset, start, stop, name = line.split(',', 5)
+                self.tasks[name] = [int(seconds), int(count), int(offset), start, stop]
+
+    def dump(self):
+        yield '%d,%s,%s\n' % (self.count, self.first, self.last)
+        for tag, seconds in self.tags.items():
+            yield 't,%d,%s\n' % (seconds, tag)
+        for name, entry in self.tasks.items():
+            yield 'n,%d,%d,%d,%s,%s,%s\n' % tuple(entry + [name])
+
+    def has_tag(self, prefix):
+        '''Check whether a tag or context starting by prefix was used'''
+        return any(tag.startswith(prefix) for tag in self.tags)
+
+    def totals(self, ids):
+        '''Get (tid, name, start, stop, seconds) for each task name, most
+        recently used first, as DailyRollup.totals does'''
+        ranked = sorted(self.tasks.items(), key=lambda item: item[1][2], reverse=True)
+        return [ids[name] + (start, stop, seconds)
+                for name, (seconds, _, _, start, stop) in ranked]
@@ -3,7 +3,7 @@
 """
 Usage:
     lets do     <name>... [--time=<time>]
-    lets see    [all|config] [--detailed|--day-by-day] [--ascii| --dot-list] [-p|--project] [<query>...]
+    lets see    [all|config] [--detailed|--day-by-day] [--ascii| --dot-list] [-p|--project] [--limit=<n> [--page=<p>]] [<query>...]
     lets edit
     lets cancel
     lets stop   [<time>...]
@@ -11,10 +11,22 @@ Usage:
     lets track  <name>...
     lets config
     lets autocomplete
+    lets complete [<prefix>]
+    lets migrate  <storage>
+    lets rebuild
+    lets import   <file>
+    lets archive
 
 options:
     -a, --ascii       Print report table in ASCII characters
     -t, --time=<time> Change the start/stop time of the task on the fly
+    -l, --limit=<n>   Show at most n tasks per report
+    --page=<p>        With --limit, show the p-th n tasks [default: 1]
+
+storages:
+    csv               History in the letsdo-data file (default)
+    sqlite            History in the letsdo-data.sqlite database
+    segments          History in yearly files in the letsdo-data.d directory
 
 examples:
     lets see            # show today's activities
@@ -26,26 +38,58 @@ examples:
     lets see this week
     lets see last month
     lets see 2019
+    lets see from 2019-03-01 to 2019-04-15
+    lets see all --limit=20 --page=2
     ...
 """
 
 import os
-import hashlib
-import re
-import json
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import docopt
-from terminaltables import SingleTable, AsciiTable
-from log import LOGGER, RAFFAELLO
-from configuration import Configuration, autocomplete
-from timetoolkit import str2datetime, strfdelta
+from functools import lru_cache, partial
+from log import LOGGER, painter, phase, phased, timed
+from configuration import Configuration, autocomplete, get_configuration
+from timetoolkit import parse_history_datetime, str2datetime, strfdelta
+from history import (
+    DayIndex,
+    NAMES,
+    NameInfo,
+    TagIndex,
+    Vocabulary,
+    reverse_fields,
+    reverse_lines,
+    sanitize,
+    task_uid,
+)
+from storage import STORAGE_ERRORS, STORAGES, get_storage, migrate
+from aggregate import aggregate
+from parallel import map_chunks, workers
+from record import HistoryRecord, RecordBatch, to_minutes
+from query import compile_query
+
+
+@lru_cache(maxsize=8192)
+@timed("paint")
+def _paint(text):
+    # Reports repeat IDs, dates, durations and names, each text is painted
+    # once per process
+    return painter().paint(text)
+
+
+def _colorizer():
+    """Get a function colorizing messages as _p does.
+
+    The configuration is checked once, when the function is made, so it can be
+    used over the cells of a whole report.
+    """
+    if get_configuration().color_enabled and painter():
+        return lambda msg: _paint(str(msg)) if msg else msg
+    return lambda msg: msg
 
 
 def _p(msg):
     """Colorize message"""
-    if msg and Configuration().color_enabled and RAFFAELLO:
-        return RAFFAELLO.paint(str(msg))
-    return msg
+    return _colorizer()(msg)
 
 
 class Task(object):
@@ -55,17 +99,20 @@ class Task(object):
         self.context = None
         self.tags = None
         self.__parse_name(name.strip())
-        self.uid = self.__hash()
+        self.__uid = None
         self.tid = tid
 
         # Adjust Task's start time with a string representing a
-        # time or a date + time,
+        # time or a date + time, or with a datetime,
         # otherwise the task starts now.
         # See std2datetime for available formats.
         self.start_time = start_str
 
         if end_str:
-            self.end_time = str2datetime(end_str.strip())
+            if isinstance(end_str, datetime):
+                self.end_time = end_str
+            else:
+                self.end_time = str2datetime(end_str.strip())
             self.work_time = self.end_time - self.start_time
             self.week_no = self.end_time.strftime("%V")
         else:
@@ -79,7 +126,9 @@ class Task(object):
 
     @start_time.setter
     def start_time(self, value):
-        if value:
+        if isinstance(value, datetime):
+            self._start_time = value
+        elif value:
             self._start_time = str2datetime(value.strip())
         else:
             self._start_time = datetime.now()
@@ -93,17 +142,17 @@ class Task(object):
 
     @staticmethod
     def __is_running():
-        exists = os.path.exists(Configuration().task_fullpath)
+        exists = get_storage().is_running()
         LOGGER.debug("Is a task running? {}".format(exists))
         return exists
 
     @staticmethod
     def get_running():
         """Check whether a task is running"""
-        if Task.__is_running():
-            with open(Configuration().task_fullpath, "r") as cfile:
-                data = json.load(cfile)
-                return Task(data["name"], data["start"])
+        running = get_storage().running()
+        if running:
+            name, start = running
+            return Task(name, start)
         return None
 
     @staticmethod
@@ -133,36 +182,16 @@ class Task(object):
         start_time_str = str(task.start_time).split(".")[0][:-3]
         stop_time_str = str(stop_time).split(".")[0][:-3]
 
-        report_line = "{date},{name},{start_time},{stop_time}\n".format(
-            date=date,
-            name=task.name,
-            start_time=start_time_str,
-            stop_time=stop_time_str,
-        )
-
-        try:
-            with open(Configuration().data_fullpath, mode="a") as cfile:
-                cfile.writelines(report_line)
-        except IOError as error:
-            LOGGER.error("Could not save report: %s", error)
+        if not get_storage().stop(date, task.name, start_time_str, stop_time_str):
             return None
 
-        # Delete current task data to mark it as stopped
-        os.remove(Configuration().task_fullpath)
-
         hours, minutes = work_time_str.split(":")
         return (hours, minutes)
 
     @staticmethod
     def cancel():
         """Interrupt task without saving it in history"""
-        task = Task.get_running()
-        if task:
-            with open(Configuration().task_fullpath, "r") as cfile:
-                content = cfile.read()
-            os.remove(Configuration().task_fullpath)
-            return content
-        return None
+        return get_storage().cancel()
 
     @staticmethod
     def status():
@@ -195,39 +224,24 @@ class Task(object):
         LOGGER.warning("Another task is running")
         return True
 
+    @property
+    def uid(self):
+        """Unique ID shared by all the tasks with this name, hashed on first use"""
+        if self.__uid is None:
+            self.__uid = self.__hash()
+        return self.__uid
+
     def __hash(self):
-        gen = hashlib.sha256(self.name.encode())
-        return gen.hexdigest()
+        return task_uid(self.name)
 
     def __create(self):
-        try:
-            with open(Configuration().task_fullpath, "w") as cfile:
-                json_data = """{
-    "name": %s,
-    "start": %s
-}
-""" % (
-                    json.dumps(self.name),
-                    json.dumps(str(self.start_time)),
-                )
-                cfile.write(json_data)
-                return True
-        except IOError as error:
-            LOGGER.error("Could not save task data: %s", error)
-            return False
+        return get_storage().start(self.name, self.start_time)
 
     def __parse_name(self, name):
-        # Sanitizing name (commas are still used to separate infos and cannot
-        # be used in task's name
-        name = name.replace(",", " ")
-        self.name = name
-        # Storing contexts (@) and projects (+)
-        matches = re.findall(r"@[\w\-_]+", name)
-        if len(matches) == 1:
-            self.context = matches[0]
-        matches = re.findall(r"\+[\w\-_]+", name)
-        if len(matches) >= 1:
-            self.tags = matches
+        # Commas are still used to separate infos and cannot be used in
+        # task's name, contexts (@) and projects (+) are stored apart
+        info = NameInfo(name)
+        self.name, self.context, self.tags = info.name, info.context, info.tags
 
     def __repr__(self):
         start_str = "None"
@@ -268,107 +282,171 @@ class Task(object):
         return self.name != other.name
 
 
+def get_task_name(task_id):
+    """Get the name of the task with the given ID, or None"""
+    try:
+        name = get_storage().name(task_id)
+    except STORAGE_ERRORS as error:
+        LOGGER.error("could not get tasks' history: %s", error)
+        return None
+    return sanitize(name) if name is not None else None
+
+
 def work_on(task_id=0, start_time_str=None):
     """Start given task id"""
-    tasks = get_tasks(condition=lambda x: x.tid == task_id)
-    tasks = group_task_by(tasks, group="name")
-    if not tasks:
+    name = get_task_name(task_id)
+    if name is None:
         LOGGER.error("could not find task ID '%s'", task_id)
     else:
-        task = tasks[0]
         start_time = None
         if start_time_str:
             date_str = datetime.strftime(datetime.today(), "%Y-%m-%d")
             start_time = date_str + " " + start_time_str
 
-        Task(task.name, start_str=start_time).start()
+        Task(name, start_str=start_time).start()
+
 
+def get_tasks(condition=None, since=None, until=None, tag=None, text=None):
+    """Get all tasks by condition
 
-def sanitize(text):
-    """Remove symbols, dates and Markdown syntax from text"""
-    # remove initial list symbol (if any)
-    if re.match(r"^[\-\*]", text):
-        text = re.sub(r"^[\-\*]", "", text)
+    Tasks come from the history storage, most recent first. since, until,
+    tag and text let the storage skip the tasks that cannot match: the ones
+    not ended in [since, until), without a +tag or @context starting by tag,
+    or without text in their name or end date.
 
-    # remove initial date (yyyy-mm-dd)
-    if re.match(r"^\s*\d+-\d+-\d+\s+", text):
-        text = re.sub(r"^\s*\d+-\d+-\d+\s+", "", text)
+    Tasks are HistoryRecord, kept in a RecordBatch.
+    """
+    try:
+        return RecordBatch(iter_tasks(condition, since, until, tag, text))
+    except STORAGE_ERRORS as error:
+        LOGGER.error("could not get tasks' history: %s", error)
+        return []
 
-    # remove initial date (yy\date-of-year)
-    if re.match(r"^\s*\d+/\d+\s+", text):
-        text = re.sub(r"^\s*\d+/\d+\s+", "", text)
 
-    # remove markdown links
-    md_link = re.compile(r"\[(.*)\]\(.*\)")
-    has_link = md_link.search(text)
-    if has_link:
-        link_name = md_link.findall(text)
-        text = re.sub(r"\[(.*)\]\(.*\)", link_name[0], text)
+def iter_tasks(condition=None, since=None, until=None, tag=None, text=None):
+    """Iterate over the tasks get_tasks returns
 
-    return text
+    A history line is read and parsed only when the task before it has been
+    consumed, so that grouping the tasks takes the memory of the groups
+    only. Storage errors are raised while iterating.
+    """
+    history = phased("history read", get_storage().history(since, until, tag, text))
+    tasks = phased("parse", (_history_task(*fields) for fields in history))
+    return phased("filter", filter(condition, tasks))
 
 
-def get_tasks(condition=None):
-    """Get all tasks by condition"""
-    tasks = []
+def _history_task(tid, name, start_str, end_str):
+    return HistoryRecord(
+        tid,
+        NAMES.lookup(name),
+        to_minutes(parse_history_datetime(start_str.strip())),
+        to_minutes(parse_history_datetime(end_str.strip())),
+    )
+
+
+def _chunk_groups(chunk, ids, condition, keys):
+    # Run by the worker processes: group the tasks of a history chunk
+    path, start, end, needles = chunk
+    tasks = (
+        _history_task(ids[NAMES.lookup(name).name][0], name, start_str, end_str)
+        for name, start_str, end_str in reverse_fields(path, start, end, needles)
+    )
+    return aggregate(filter(condition, tasks), keys)
+
+
+def parallel_task_totals(condition=None, since=None, until=None, tag=None, text=None,
+                         daily=False, count=2):
+    """Get tasks grouped as get_task_totals does, parsing the history in
+    count worker processes, or None if the history cannot be split
+
+    Each worker groups the tasks of chunks of history, which are merged
+    newest chunk first: groups keep the same order, task IDs, names and
+    times as if the history was parsed all at once.
+    """
+    # Only reports parsing in parallel need it
+    import pickle
 
-    tid = 0
-    uids = dict()
     try:
-        with open(Configuration().data_fullpath) as cfile:
-            for line in reversed(cfile.readlines()):
-                fields = line.strip().split(",")
-                if not fields[1]:
-                    continue
-
-                # Take care of old history format with worked_time
-                if len(fields) == 5:
-                    task = Task(
-                        name=sanitize(fields[1]), start_str=fields[3], end_str=fields[4]
-                    )
-                elif len(fields) == 4:
-                    task = Task(
-                        name=sanitize(fields[1]), start_str=fields[2], end_str=fields[3]
-                    )
+        pickle.dumps(condition)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        LOGGER.debug("condition %r cannot be sent to workers", condition)
+        return None
+
+    storage = get_storage()
+    with phase("history read"):
+        chunks = storage.chunks(since, until, tag, text, count)
+    if not chunks or len(chunks) < 2:
+        return None
+
+    keys = ("date", "name") if daily else ("name",)
+    function = partial(_chunk_groups, ids=storage.ids(), condition=condition, keys=keys)
+    groups = OrderedDict()
+    with phase("parse"):
+        for chunk_groups in map_chunks(function, chunks, count):
+            for key, group in chunk_groups.items():
+                if key in groups:
+                    groups[key].merge(group)
                 else:
-                    raise Exception(
-                        "History unexpected fields ({}: {})".format(len(fields), fields)
-                    )
+                    groups[key] = group
+    return list(groups.values())
 
-                # Tasks with same UID share the same Task ID as well
-                # Integer IDs are easier to use than hash IDs
-                if task.uid not in uids:
-                    tid += 1
-                    uids[task.uid] = tid
-                task.tid = uids[task.uid]
-                tasks.append(task)
-
-        conditioned = filter(condition, tasks)
-        return list(conditioned)
-    except IOError as error:
-        LOGGER.error("could not get tasks' history: %s", error)
-        return []
 
+def get_task_totals(condition=None, since=None, until=None, tag=None, text=None,
+                    exact=False, daily=False):
+    """Get tasks grouped by name, or by end day and name if daily, with their
+    total work time
+
+    If exact, the tasks matching condition are just the ones selected by
+    since, until, tag and text, so the storage can compute the totals itself.
+    """
+    totals = None
+    if exact:
+        try:
+            with phase("history read"):
+                totals = get_storage().totals(since, until, tag, text, daily)
+        except STORAGE_ERRORS as error:
+            LOGGER.error("could not get tasks' history: %s", error)
+            return []
+
+    if totals is None and workers() > 1:
+        try:
+            groups = parallel_task_totals(condition, since, until, tag, text, daily, workers())
+        except STORAGE_ERRORS as error:
+            LOGGER.error("could not get tasks' history: %s", error)
+            return []
+        if groups is not None:
+            return groups
+
+    if totals is None:
+        # Tasks are grouped as they are parsed, one at a time
+        keys = ("date", "name") if daily else ("name",)
+        try:
+            with phase("group"):
+                tasks = iter_tasks(condition, since, until, tag, text)
+                return list(aggregate(tasks, keys).values())
+        except STORAGE_ERRORS as error:
+            LOGGER.error("could not get tasks' history: %s", error)
+            return []
 
+    tasks = []
+    with phase("parse"):
+        for tid, name, start_str, end_str, seconds in totals:
+            task = Task(
+                name=NAMES.lookup(name).name,
+                start_str=parse_history_datetime(start_str),
+                end_str=parse_history_datetime(end_str),
+                tid=tid,
+            )
+            task.work_time = timedelta(seconds=seconds)
+            tasks.append(task)
+    return tasks
+
+
+@timed("group")
 def group_task_by(tasks, group=None):
     """Group given task by name or date"""
     if group == "name":
-        uniques = []
-        for task in tasks:
-            if task not in uniques:
-                uniques.append(task)
-
-        for main_task in uniques:
-            work_time_in_seconds = sum(
-                [
-                    same_task.work_time.seconds
-                    for same_task in tasks
-                    if same_task == main_task
-                ]
-            )
-            work_time = timedelta(seconds=work_time_in_seconds)
-            main_task.work_time = work_time
-        return uniques
+        return list(aggregate(tasks, ("name",)).values())
 
     if group == "date":
         task_map = {}
@@ -384,56 +462,89 @@ def group_task_by(tasks, group=None):
     return tasks
 
 
-def report_task(tasks, title=None, detailed=False, ascii=False):
-    """Display table with tasks data"""
+def _page_of(tasks, limit, page):
+    """Get the page-th group of limit tasks, or all the tasks without a limit"""
+    if not limit:
+        return tasks
+    return tasks[(page - 1) * limit : page * limit]
+
+
+@timed("render")
+def report_task(tasks, title=None, detailed=False, ascii=False, limit=None, page=1):
+    """Display table with tasks data
+
+    With a limit, only the page-th group of limit tasks is shown, while the
+    percentages and the footer still account for all the tasks. Rows are
+    printed as they are made, see StreamingTable.
+    """
+    from table import StreamingTable
+    from terminaltables import SingleTable, AsciiTable
 
-    table_data = [["ID", "Last update", "Work time", "Description"]]
+    heading = ["ID", "Last update", "Work time", "Description"]
     if detailed:
-        table_data = [["ID", "Last update", "Work time", "Interval", "Description"]]
+        heading = ["ID", "Last update", "Work time", "Interval", "Description"]
         tasks = sorted(tasks, key=lambda x: x.end_time, reverse=True)
 
+    paint = _colorizer()
     tot_work_time = timedelta()
     for task in tasks:
         tot_work_time += task.work_time
 
-    for task in tasks:
-        last_time = ""
-        if task.last_end_date:
-            if task.tid != "R":
-                last_time = task.end_time.strftime("%d-%m-%Y w%V")
-            else:
-                last_time = task.start_time.strftime("%Y-%m-%d %H:%M")
+    shown = _page_of(tasks, limit, page)
+    if limit and title:
+        pages = max(1, -(-len(tasks) // limit))
+        title = "%s, page %d of %d" % (title, page, pages)
 
-        perc = 0
-        if tot_work_time > timedelta(0):
-            perc = int((task.work_time / tot_work_time) * 100)
+    if len(shown) == 0:
+        print(paint("Nothing to show for %s" % title))
+        return
 
-        time = "{} {:2d}%".format(
-            strfdelta(task.work_time, fmt="{H:2}h {M:02}m"), perc
-        )
+    def percentage(work_time):
+        if tot_work_time > timedelta(0):
+            return int((work_time / tot_work_time) * 100)
+        return 0
 
-        # smart break message at boundaries
-        task_name = task.name
-        if len(task.name) > 53:
-            word_break = task_name.find(" ", 45)
-            if word_break == -1:
-                word_break = 45
-            task_name = task_name[:word_break] + "\n ⤷" + task_name[word_break:]
+    def rows():
+        for task in shown:
+            last_time = ""
+            if task.last_end_date:
+                if task.tid != "R":
+                    last_time = task.end_time.strftime("%d-%m-%Y w%V")
+                else:
+                    last_time = task.start_time.strftime("%Y-%m-%d %H:%M")
 
-        if detailed:
-            begin = task.start_time.strftime("%H:%M")
-            end = task.end_time.strftime("%H:%M")
-            interval = "{} -> {}".format(begin, end)
+            time = "{} {:2d}%".format(
+                strfdelta(task.work_time, fmt="{H:2}h {M:02}m"), percentage(task.work_time)
+            )
 
-            row = [_p(task.tid), _p(last_time), _p(time), _p(interval), _p(task_name)]
-        else:
-            row = [_p(task.tid), _p(last_time), _p(time), _p(task_name)]
+            # smart break message at boundaries
+            task_name = task.name
+            if len(task.name) > 53:
+                word_break = task_name.find(" ", 45)
+                if word_break == -1:
+                    word_break = 45
+                task_name = task_name[:word_break] + "\n ⤷" + task_name[word_break:]
 
-        table_data.append(row)
+            if detailed:
+                begin = task.start_time.strftime("%H:%M")
+                end = task.end_time.strftime("%H:%M")
+                interval = "{} -> {}".format(begin, end)
 
-    if len(tasks) == 0:
-        print(_p("Nothing to show for %s" % title))
-        return
+                yield [task.tid, last_time, time, interval, task_name]
+            else:
+                yield [task.tid, last_time, time, task_name]
+
+    # Widths of the fixed format columns, so that rows past the ones sampled
+    # by StreamingTable fit them too
+    longest = max(task.work_time for task in shown)
+    widths = [
+        max(len(str(task.tid)) for task in shown),
+        max(16 if task.tid == "R" else 14 for task in shown if task.last_end_date)
+        if any(task.last_end_date for task in shown) else 0,
+        len("{} {:2d}%".format(strfdelta(longest, fmt="{H:2}h {M:02}m"), percentage(longest))),
+    ]
+    if detailed:
+        widths.append(len("00:00 -> 00:00"))
 
     if title:
         title = " %s " % title
@@ -442,19 +553,17 @@ def report_task(tasks, title=None, detailed=False, ascii=False):
         recap = "activities,"
     else:
         recap = "activity,"
-    table_data.append(
-        [
-            len(tasks),
-            recap,
-            "total time:",
-            _p(strfdelta(tot_work_time, fmt="{D:2}d {H:2}h {M:02}m")),
-        ]
-    )
+    footer = [
+        len(tasks),
+        recap,
+        "total time:",
+        paint(strfdelta(tot_work_time, fmt="{D:2}d {H:2}h {M:02}m")),
+    ]
 
     if ascii:
-        table = AsciiTable(table_data, title)
+        table = AsciiTable([], title)
     else:
-        table = SingleTable(table_data, title)
+        table = SingleTable([], title)
 
     table.outer_border = True
     table.inner_column_border = False
@@ -466,111 +575,60 @@ def report_task(tasks, title=None, detailed=False, ascii=False):
     table.justify_columns[3] = "left"
 
     print("")
-    print(table.table)
-
-
-def __is_a_month(string):
-    months = [
-        "jan",
-        "feb",
-        "mar",
-        "apr",
-        "may",
-        "jun",
-        "jul",
-        "aug",
-        "sep",
-        "oct",
-        "nov",
-        "dec",
-    ]
-    if string.lower() in months:
-        return True
-
-    for month in months:
-        if month in string.lower():
-            return True
-
-    return False
-
-
-def __get_time_format_from_query(query):
-    format = "%Y-%m-%d"
-
-    if not query:
-        return format
-
-    if "last year" in query:
-        format = "%Y"
-    elif "week" in query:
-        format = "%V"
-        week_check = True
-    elif "month" in query or __is_a_month(query):
-        format = "%Y-%m"
-
-    return format
-
-
-def __get_task_condition_from_query(query):
-    format = __get_time_format_from_query(query)
-    try:
-        query = datetime.strftime(str2datetime(query), format)
-    except:
-        LOGGER.debug("query '%s' does not seems a date", query)
-
-    if format == "%V":
-        condition = lambda x: x.week_no == query and x.end_time.strftime(
-            "%Y"
-        ) == datetime.now().strftime("%Y")
-    else:
-        condition = lambda x: not query or (
-            query in str(x.last_end_date) or query in x.name
-        )
-
-    return condition, query, format
+    for line in StreamingTable(table, heading, footer, widths, paint).lines(rows()):
+        print(line)
 
 
 def do_report(args):
     """Wrap show reports"""
 
+    try:
+        limit = int(args["--limit"]) if args.get("--limit") else None
+        page = int(args.get("--page") or 1)
+    except ValueError:
+        limit = page = 0
+    if (limit is not None and limit < 1) or page < 1:
+        LOGGER.error("--limit and --page must be positive numbers")
+        return 1
+
     if not args["all"] and not args["<query>"]:
         args["<query>"] = "today"
 
     query = args["<query>"]
 
-    condition, date, format = __get_task_condition_from_query(query)
-
-    if format == "%V":
-        title = "week {}".format(date)
-    else:
-        title = "{}".format(date)
-
-    tasks = get_tasks(condition)
+    # The storage skips what the plan excludes
+    plan = compile_query(query, limit, page)
+    condition, selection, exact = plan.matches, plan.selection, plan.exact
+    pages = dict(limit=plan.limit, page=plan.page)
+    title = plan.title
 
     if args["--detailed"]:
+        tasks = get_tasks(condition, **selection)
         tasks.reverse()
-        report_task(tasks, title=title, detailed=True, ascii=args["--ascii"])
+        report_task(tasks, title=title, detailed=True, ascii=args["--ascii"], **pages)
         return
 
     if args["--day-by-day"]:
-        task_map = group_task_by(tasks, "date")
+        task_map = {}
+        for task in get_task_totals(condition, exact=exact, daily=True, **selection):
+            task_map.setdefault(task.last_end_date, []).append(task)
 
         for key in sorted(task_map.keys()):
             if not key:
                 continue
 
-            task = group_task_by(task_map[key], "name")
-            sorted_by_time = sorted(task, key=lambda x: x.work_time, reverse=True)
+            sorted_by_time = sorted(task_map[key], key=lambda x: x.work_time, reverse=True)
 
-            report_task(sorted_by_time)
+            report_task(sorted_by_time, **pages)
         return
 
-    tasks = group_task_by(tasks, "name")
+    tasks = get_task_totals(condition, exact=exact, **selection)
     if args["--dot-list"]:
-        print(_p("\n{}".format(title)))
+        paint = _colorizer()
+        print(paint("\n{}".format(title)))
 
-        for task in tasks:
-            print(_p(" ● (%s) %s" % (task.tid, task.name)))
+        for task in _page_of(tasks, plan.limit, plan.page):
+            print(paint(" ● (%s) %s" % (task.tid, task.name)))
         return
 
     running = Task.get_running()
@@ -583,7 +641,9 @@ def do_report(args):
         running.end_time = running.start_time
         tasks.insert(0, running)
 
-    report_task(tasks, title=title, detailed=args["--detailed"], ascii=args["--ascii"])
+    report_task(
+        tasks, title=title, detailed=args["--detailed"], ascii=args["--ascii"], **pages
+    )
 
 
 def guess_task_id_from_string(task_name):
@@ -598,14 +658,78 @@ def guess_task_id_from_string(task_name):
     return guess_id
 
 
+def complete(prefix):
+    """Print the tags, contexts or task names starting by prefix"""
+    try:
+        words = get_storage().complete(prefix)
+    except STORAGE_ERRORS as error:
+        LOGGER.debug("could not load vocabulary: %s", error)
+        return
+    for word in words:
+        print(word)
+
+
 def main():
-    global RAFFAELLO
+    import docopt
+
     args = docopt.docopt(__doc__)
 
     if args["autocomplete"]:
         autocomplete()
         return
 
+    if args["complete"]:
+        complete(args["<prefix>"] or "")
+        return 0
+
+    if args["migrate"]:
+        storage = args["<storage>"]
+        if storage not in STORAGES:
+            LOGGER.error("unknown storage '%s', use one of: %s", storage, ", ".join(STORAGES))
+            return 1
+        if not migrate(storage):
+            return 1
+        print("history moved to %s storage" % storage)
+        return 0
+
+    if args["import"]:
+        from timesheet import read_timesheet
+
+        try:
+            rows = read_timesheet(args["<file>"])
+        except (IOError, ValueError) as error:
+            LOGGER.error("could not import '%s': %s", args["<file>"], error)
+            return 1
+        try:
+            get_storage().merge(rows)
+        except STORAGE_ERRORS as error:
+            LOGGER.error("could not save imported tasks: %s", error)
+            return 1
+        print("imported %d tasks" % len(rows))
+        return 0
+
+    if args["archive"]:
+        try:
+            archives = get_storage().archive()
+        except STORAGE_ERRORS as error:
+            LOGGER.error("could not archive history: %s", error)
+            return 1
+        if archives is None:
+            LOGGER.error("only the segments storage can be archived, see 'lets migrate'")
+            return 1
+        for archive in archives:
+            print("archived %s" % archive)
+        return 0
+
+    if args["rebuild"]:
+        try:
+            get_storage().rebuild()
+        except STORAGE_ERRORS as error:
+            LOGGER.error("could not rebuild history indexes: %s", error)
+            return 1
+        print("history indexes rebuilt")
+        return 0
+
     if args["do"]:
         if Task.get_running():
             print("Another task is already running")
@@ -655,7 +779,7 @@ def main():
             return
 
         edit_command = "{editor} {filename}".format(
-            editor=os.getenv("EDITOR"), filename=Configuration().task_fullpath
+            editor=os.getenv("EDITOR"), filename=get_configuration().task_fullpath
         )
         os.system(edit_command)
         return 0
@@ -695,14 +819,12 @@ def main():
 
         tid = guess_task_id_from_string(name)
         if tid:
-            tasks = get_tasks(lambda x: x.tid == tid)
+            name = get_task_name(tid)
 
-            if not tasks:
+            if name is None:
                 LOGGER.error("could not find tasks id %s", tid)
                 return 1
 
-            name = tasks[0].name
-
         task = Task.get_running()
         if task:
             work_time = Task.stop()
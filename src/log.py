@@ -1,31 +1,75 @@
 '''
 Logging facility
+
+Set LETSDO_DEBUG to see debug messages.
+
+Set LETSDO_PROFILE to 1 to get the wall time of each phase of a command
+(config, history read, parse, filter, group, render, paint) and counters,
+such as the hits and misses of the name table, on stderr, or to a file
+path to have them appended to it. Set LETSDO_PROFILE_STATS to a
+file path to dump there the cProfile statistics of the whole command.
 '''
 import os
 import sys
-import logging
+from collections import OrderedDict
+from functools import wraps
+from time import perf_counter
+
+REQUEST = r'''\+[\w\-_\.]+=>color197 \@[\w\-_]+=>color046 \#[\w\-_]+=>color202 \d+[dms]=>color011 \d+h\s=>color011 \d{2,4}-\d{2}-\d{2,4}=>color011 \d{2,4}.\d{2}.\d{2,4}=>color011 w\d{2}=>color011 \d{2}:\d{2}=>color011'''
+
+# Raffaello is slow to import, the painter is built the first time it is used
+_RAFFAELLO = None
+
+
+def painter():
+    '''Get the Raffaello painter, or None if raffaello is not installed'''
+    global _RAFFAELLO
+    if _RAFFAELLO is None:
+        try:
+            from raffaello import Raffaello
+            from raffaello import parse_string_request
+            _RAFFAELLO = Raffaello(parse_string_request(REQUEST))
+        except ImportError:
+            _RAFFAELLO = False
+    return _RAFFAELLO or None
+
+
+DEBUG = 'LETSDO_DEBUG' in os.environ
+
+
+def _ignore(*args, **kwargs):
+    pass
+
+
+class _Logger(object):
+    '''The letsdo logger, set up the first time a message is logged.
+
+    Importing logging is slow and most commands log nothing but debug
+    messages, which are dropped without logging unless LETSDO_DEBUG is set.
+    '''
+    def __init__(self):
+        self.__logger = None
 
-try:
-    from raffaello import Raffaello
-    from raffaello import parse_string_request
+    def __getattr__(self, name):
+        if name == 'debug' and not DEBUG:
+            return _ignore
+        if self.__logger is None:
+            import logging
 
-    REQUEST = r'''\+[\w\-_\.]+=>color197 \@[\w\-_]+=>color046 \#[\w\-_]+=>color202 \d+[dms]=>color011 \d+h\s=>color011 \d{2,4}-\d{2}-\d{2,4}=>color011 \d{2,4}.\d{2}.\d{2,4}=>color011 w\d{2}=>color011 \d{2}:\d{2}=>color011'''
-    RAFFAELLO = Raffaello(parse_string_request(REQUEST))
-except ImportError as error:
-    RAFFAELLO = None
+            level = logging.DEBUG if DEBUG else logging.INFO
+            logging.basicConfig(level=level, format='%(levelname)s %(funcName)s: %(message)s')
+            self.__logger = logging.getLogger(__name__)
+        return getattr(self.__logger, name)
 
-if 'LETSDO_DEBUG' in os.environ:
-    LEVEL = logging.DEBUG
-else:
-    LEVEL = logging.INFO
 
-logging.basicConfig(level=LEVEL, format='%(levelname)s %(funcName)s: %(message)s')
-LOGGER = logging.getLogger(__name__)
+LOGGER = _Logger()
+
 
 def info(msg):
     '''Info level logging'''
-    if RAFFAELLO:
-        print(RAFFAELLO.paint(msg))
+    raffaello = painter()
+    if raffaello:
+        print(raffaello.paint(msg))
     else:
         print(msg)
 
@@ -43,3 +87,132 @@ def warn(msg):
 def dbg(msg):
     '''Debug level logging'''
     LOGGER.debug(msg)
+
+
+PROFILE = os.environ.get('LETSDO_PROFILE')
+PROFILE_STATS = os.environ.get('LETSDO_PROFILE_STATS')
+
+# Phase name -> [seconds, calls], in order of first use
+_PHASES = OrderedDict()
+_START = perf_counter()
+# Counters name -> function getting them as {label: count}
+_COUNTERS = OrderedDict()
+
+
+class _Phase(object):
+    '''Add the wall time of a block to a phase.
+
+    Phases nest: a phase counts only the time not spent in the phases it
+    contains, e.g. paint within render.
+    '''
+    stack = []
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+        self.nested = 0.0
+
+    def __enter__(self):
+        _Phase.stack.append(self)
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter() - self.start
+        _Phase.stack.pop()
+        if _Phase.stack:
+            _Phase.stack[-1].nested += elapsed
+        total = _PHASES.setdefault(self.name, [0.0, 0])
+        total[0] += elapsed - self.nested
+        total[1] += 1
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name):
+    '''Time a block as a phase of the command, if LETSDO_PROFILE is set'''
+    if PROFILE:
+        return _Phase(name)
+    return _NO_PHASE
+
+
+def phased(name, iterable):
+    '''Time the iteration of iterable as a phase, if LETSDO_PROFILE is set'''
+    if not PROFILE:
+        return iterable
+    return _phased(name, iterable)
+
+
+def timed(name):
+    '''Decorator timing each call as a phase, if LETSDO_PROFILE is set'''
+    def decorator(function):
+        if not PROFILE:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def counters(name, function):
+    '''Report the counts function returns with the phases, if LETSDO_PROFILE
+    is set'''
+    _COUNTERS[name] = function
+
+
+def _phased(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with _Phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _report_phases():
+    lines = ['letsdo profile: %s' % ' '.join(sys.argv)]
+    for name, (seconds, calls) in _PHASES.items():
+        lines.append('  %-14s %9.4fs %8d calls' % (name, seconds, calls))
+    for name, function in _COUNTERS.items():
+        lines.append('  %-14s %s' % (name, ' '.join(
+            '%d %s' % (count, label) for label, count in function().items())))
+    lines.append('  %-14s %9.4fs' % ('total', perf_counter() - _START))
+    report = '\n'.join(lines) + '\n'
+
+    if PROFILE in ('1', 'stderr'):
+        sys.stderr.write(report)
+    else:
+        with open(PROFILE, 'a') as pfile:
+            pfile.write(report)
+
+
+if PROFILE or PROFILE_STATS:
+    import atexit
+
+    if PROFILE:
+        atexit.register(_report_phases)
+    if PROFILE_STATS:
+        import cProfile
+
+        _PROFILER = cProfile.Profile()
+
+        def _dump_stats():
+            _PROFILER.disable()
+            _PROFILER.dump_stats(PROFILE_STATS)
+
+        _PROFILER.enable()
+        atexit.register(_dump_stats)
@@ -0,0 +1,57 @@
+'''
+Parsing of history chunks across a pool of processes
+
+Set LETSDO_WORKERS to a number of processes to have the history lines of
+long reports parsed by them, each one parsing a chunk of the history files.
+Reports are parsed by the command process otherwise.
+'''
+import os
+from log import LOGGER
+
+# Bytes of history lines below which a chunk is not worth a process
+MIN_CHUNK_SIZE = 256 * 1024
+
+
+def workers():
+    '''Get the number of worker processes set by LETSDO_WORKERS, or 0'''
+    value = os.environ.get('LETSDO_WORKERS', '')
+    try:
+        return max(0, int(value))
+    except ValueError:
+        if value:
+            LOGGER.warning('LETSDO_WORKERS is not a number: %s', value)
+        return 0
+
+
+def split_ranges(path, ranges, count, min_size=MIN_CHUNK_SIZE):
+    '''Split the sorted (start, end) byte ranges of the history file at path
+    in about count chunks of at least min_size bytes, cut at line
+    boundaries. Returns the (start, end) chunks, newest first.'''
+    total = sum(end - start for start, end in ranges)
+    size = max(min_size, -(-total // max(count, 1)))
+    chunks = []
+    with open(path, 'rb') as cfile:
+        for start, end in ranges:
+            while start < end:
+                cut = start + size
+                if cut < end:
+                    # Move the cut past the end of the line it falls in
+                    cfile.seek(cut - 1)
+                    cfile.readline()
+                    cut = min(cfile.tell(), end)
+                else:
+                    cut = end
+                chunks.append((start, cut))
+                start = cut
+    chunks.reverse()
+    return chunks
+
+
+def map_chunks(function, chunks, count):
+    '''Call function on each chunk in a pool of count processes, returns the
+    results in the order of chunks'''
+    # It imports logging, commands not parsing in parallel do not need it
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(function, chunks))
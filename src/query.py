@@ -0,0 +1,186 @@
+'''
+Compilation of report queries into plans of the tasks to read
+'''
+import re
+from datetime import datetime, timedelta
+from log import LOGGER
+from timetoolkit import str2datetime
+
+# A query made of a single +tag or @context
+TAG_QUERY = re.compile(r"^[@\+][\w\-_]+$")
+
+# A year, month or day: 2019, 2019-03 or 2019-03-01
+DATE_QUERY = re.compile(r"^\d{4}(-\d{2}){0,2}$")
+DATE_FORMATS = {4: "%Y", 7: "%Y-%m", 10: "%Y-%m-%d"}
+
+# An arbitrary range of days: from 2019-03-01 [to 2019-04-15]
+RANGE_QUERY = re.compile(r"^from\s+(?P<since>.+?)(?:\s+to\s+(?P<until>.+))?$", re.IGNORECASE)
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+
+class QueryPlan(object):
+    """The tasks selected by a query: the ones ended in [since, until), with a
+    +tag or @context starting by tag and with text in their name or end day.
+
+    If ranges is given, only the tasks ended in one of its [start, end) ranges
+    match, and since and until are its bounds. limit and page select the tasks
+    to show. The selection dict can be handed to the storage readers, which
+    skip what it excludes.
+    """
+
+    def __init__(self, title, since=None, until=None, tag=None, text=None, ranges=None,
+                 limit=None, page=1):
+        self.title = title
+        self.since = since
+        self.until = until
+        self.tag = tag
+        self.text = text
+        self.ranges = ranges
+        self.limit = limit
+        self.page = page
+        # End days are only formatted for texts that can be found in them
+        self.__dated = bool(text) and not text.strip("0123456789-")
+
+    @property
+    def selection(self):
+        """Keyword arguments of the readers, see get_tasks"""
+        return dict(since=self.since, until=self.until, tag=self.tag, text=self.text)
+
+    @property
+    def exact(self):
+        """Whether the readers select exactly the tasks matching the plan"""
+        return self.ranges is None
+
+    def matches(self, task):
+        """Check whether a task is selected by the plan"""
+        end_time = task.end_time
+        if self.since and end_time < self.since:
+            return False
+        if self.until and end_time >= self.until:
+            return False
+        if self.ranges and not any(start <= end_time < end for start, end in self.ranges):
+            return False
+        if self.tag and self.tag not in task.name:
+            return False
+        if self.text and self.text not in task.name:
+            return self.__dated and self.text in task.last_end_date
+        return True
+
+    def __repr__(self):
+        return "QueryPlan(%r, [%s, %s), tag=%r, text=%r)" % (
+            self.title, self.since, self.until, self.tag, self.text)
+
+
+def _is_a_month(string):
+    return any(month in string.lower() for month in MONTHS)
+
+
+def _day(time):
+    return time.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(day):
+    return (day + timedelta(days=31)).replace(day=1)
+
+
+def _period_plan(since, format):
+    # The year, month or day starting at since, as told by format
+    if format == "%Y":
+        until = since.replace(year=since.year + 1)
+    elif format == "%Y-%m":
+        until = _next_month(since)
+    else:
+        until = since + timedelta(days=1)
+    return QueryPlan(since.strftime(format), since, until)
+
+
+def _week_plan(query):
+    # The days of the current year in the ISO week of the query
+    week = str2datetime(query).strftime("%V")
+    year = datetime.now().year
+    ranges = []
+    for week_year in (year - 1, year, year + 1):
+        monday = datetime.strptime("%d-%s-1" % (week_year, week), "%G-%V-%u")
+        if monday.isocalendar()[:2] != (week_year, int(week)):
+            continue
+        start = max(monday, datetime(year, 1, 1))
+        end = min(monday + timedelta(days=7), datetime(year + 1, 1, 1))
+        if start < end:
+            ranges.append((start, end))
+    if not ranges:
+        raise ValueError("no week %s in %d" % (week, year))
+    return QueryPlan(
+        "week %s" % week, ranges[0][0], ranges[-1][1],
+        ranges=ranges if len(ranges) > 1 else None)
+
+
+def _range_plan(since, until):
+    since = _day(str2datetime(since))
+    title = "from %s" % since.strftime("%Y-%m-%d")
+    if until:
+        until = _day(str2datetime(until))
+        title += " to %s" % until.strftime("%Y-%m-%d")
+        until += timedelta(days=1)
+    return QueryPlan(title, since, until)
+
+
+def _date_plan(query):
+    if "last year" in query:
+        format = "%Y"
+    elif "month" in query or _is_a_month(query):
+        format = "%Y-%m"
+    else:
+        format = "%Y-%m-%d"
+
+    since = _day(str2datetime(query))
+    if format == "%Y":
+        since = since.replace(month=1, day=1)
+    elif format == "%Y-%m":
+        since = since.replace(day=1)
+    return _period_plan(since, format)
+
+
+def compile_query(query, limit=None, page=1):
+    """Compile a report query into a QueryPlan
+
+    Queries are relative days, weeks, months and years ('yesterday',
+    'this week', 'last July', 'last year'), dates ('2019', '2019-03',
+    '2019-03-01'), ranges of days ('from 2019-03-01 to 2019-04-15'), a
+    +tag or @context, or any text to be found in task names. No query
+    selects all the tasks.
+    """
+    plan = None
+    if not query:
+        plan = QueryPlan("all")
+    elif RANGE_QUERY.match(query):
+        match = RANGE_QUERY.match(query)
+        try:
+            plan = _range_plan(match.group("since"), match.group("until"))
+        except ValueError:
+            LOGGER.debug("query '%s' does not seems a range", query)
+    elif DATE_QUERY.match(query):
+        format = DATE_FORMATS[len(query)]
+        try:
+            plan = _period_plan(datetime.strptime(query, format), format)
+        except ValueError:
+            LOGGER.debug("query '%s' does not seems a date", query)
+    elif "week" in query:
+        try:
+            plan = _week_plan(query)
+        except ValueError:
+            LOGGER.debug("query '%s' does not seems a week", query)
+    else:
+        try:
+            plan = _date_plan(query)
+        except ValueError:
+            LOGGER.debug("query '%s' does not seems a date", query)
+
+    if plan is None:
+        if TAG_QUERY.match(query):
+            plan = QueryPlan(query, tag=query)
+        else:
+            plan = QueryPlan(query, text=query)
+    plan.limit = limit
+    plan.page = page
+    return plan
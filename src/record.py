@@ -0,0 +1,141 @@
+'''
+Compact records of the tasks read from history
+'''
+from array import array
+from datetime import datetime, timedelta
+
+# Times are kept as minutes since EPOCH, the precision of history
+EPOCH = datetime(1970, 1, 1)
+_EPOCH_DAY = EPOCH.toordinal()
+
+
+def to_minutes(time):
+    '''Get the minutes from EPOCH to a datetime, seconds are dropped'''
+    return (time.toordinal() - _EPOCH_DAY) * 1440 + time.hour * 60 + time.minute
+
+
+def from_minutes(minutes):
+    '''Get the datetime minutes after EPOCH'''
+    return EPOCH + timedelta(minutes=minutes)
+
+
+class HistoryRecord(object):
+    '''A task read from history, with the attributes reports read from a
+    Task, which is kept for the running task.
+
+    Records hold their ID, the NameInfo of their name and their times only,
+    everything else is computed when it is read. The records of a task share
+    its NameInfo, and times are kept as integer minutes since EPOCH.
+    '''
+    __slots__ = ('tid', 'info', 'start', 'stop')
+
+    def __init__(self, tid, info, start, stop):
+        self.tid = tid
+        self.info = info
+        self.start = start
+        self.stop = stop
+
+    @property
+    def name(self):
+        return self.info.name
+
+    @property
+    def start_time(self):
+        return from_minutes(self.start)
+
+    @property
+    def end_time(self):
+        return from_minutes(self.stop)
+
+    @property
+    def work_time(self):
+        return timedelta(minutes=self.stop - self.start)
+
+    @property
+    def last_end_date(self):
+        """ The last day when this task was active"""
+        return self.end_time.strftime("%Y-%m-%d")
+
+    @property
+    def week_no(self):
+        return self.end_time.strftime("%V")
+
+    @property
+    def context(self):
+        return self.info.context
+
+    @property
+    def tags(self):
+        return self.info.tags
+
+    @property
+    def uid(self):
+        return self.info.uid
+
+    def __repr__(self):
+        return "[%s] - %s| %s (%s -> %s) - %s" % (
+            self.tid,
+            self.last_end_date,
+            str(self.work_time),
+            self.start_time.strftime("%H:%M"),
+            self.end_time.strftime("%H:%M"),
+            self.name,
+        )
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+    def __ne__(self, other):
+        return self.name != other.name
+
+
+class RecordBatch(object):
+    '''A list of history records stored in columns: IDs and times in
+    arrays of integers, names in a list of shared NameInfo.
+
+    Records are made again each time they are read, changing one does not
+    change the batch.
+    '''
+
+    def __init__(self, records=()):
+        self.tids = array('l')
+        self.infos = []
+        self.starts = array('q')
+        self.stops = array('q')
+        for record in records:
+            self.append(record)
+
+    def append(self, record):
+        '''Add a record at the end of the batch'''
+        self.tids.append(record.tid)
+        self.infos.append(record.info)
+        self.starts.append(record.start)
+        self.stops.append(record.stop)
+
+    def reverse(self):
+        '''Reverse the order of the records, in place'''
+        for column in (self.tids, self.infos, self.starts, self.stops):
+            column.reverse()
+
+    def __record(self, index):
+        record = HistoryRecord.__new__(HistoryRecord)
+        record.tid = self.tids[index]
+        record.info = self.infos[index]
+        record.start = self.starts[index]
+        record.stop = self.stops[index]
+        return record
+
+    def __len__(self):
+        return len(self.infos)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__record(position) for position in range(*index.indices(len(self)))]
+        return self.__record(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.__record(index)
+
+    def __repr__(self):
+        return "RecordBatch(%d records)" % len(self)
@@ -0,0 +1,805 @@
+'''
+Storage backends of the tasks' history
+'''
+import heapq
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta
+from operator import itemgetter
+from configuration import get_configuration
+from history import (
+    ARCHIVES,
+    DailyRollup,
+    DayIndex,
+    Seal,
+    TagIndex,
+    TaskTable,
+    TAGS_PATTERN,
+    Vocabulary,
+    is_archive,
+    name_info,
+    open_history,
+    reverse_fields,
+    reverse_lines,
+    signature,
+)
+from log import LOGGER
+from parallel import split_ranges
+from timetoolkit import parse_history_datetime
+
+
+def _glob_prefix(prefix):
+    """Get the GLOB pattern matching the strings starting by prefix"""
+    return re.sub(r"([\[\]\*\?])", r"[\1]", prefix) + '*'
+
+
+def _end_time(fields):
+    """Get the end time of the fields of a history line"""
+    return parse_history_datetime(fields[-1].strip())
+
+
+def _merge(old, new):
+    """Merge two sequences of (end time, line), each in time order, the old
+    lines first on ties"""
+    return (line for _, line in heapq.merge(old, new, key=itemgetter(0)))
+
+
+def _union(ranges):
+    """Get the sorted union of (start, end) offset ranges"""
+    union = []
+    for start, end in sorted(ranges):
+        if union and start <= union[-1][1]:
+            union[-1] = (union[-1][0], max(union[-1][1], end))
+        else:
+            union.append((start, end))
+    return union
+
+
+class Storage(object):
+    '''Base class of the history storages.
+
+    The running task is kept in the letsdo-task file by every storage, so
+    that it can be changed with "lets edit". Subclasses store the history of
+    stopped tasks.
+    '''
+    NAME = None
+
+    def __init__(self, configuration):
+        self.data_directory = configuration.data_directory
+        self.task_path = configuration.task_fullpath
+
+    def is_running(self):
+        '''Check whether a task is running'''
+        return os.path.exists(self.task_path)
+
+    def running(self):
+        '''Get name and start time string of the running task, or None'''
+        if not self.is_running():
+            return None
+        with open(self.task_path, "r") as cfile:
+            data = json.load(cfile)
+        return data["name"], data["start"]
+
+    def start(self, name, start_time):
+        '''Save the running task'''
+        try:
+            with open(self.task_path, "w") as cfile:
+                json_data = """{
+    "name": %s,
+    "start": %s
+}
+""" % (
+                    json.dumps(name),
+                    json.dumps(str(start_time)),
+                )
+                cfile.write(json_data)
+                return True
+        except IOError as error:
+            LOGGER.error("Could not save task data: %s", error)
+            return False
+
+    def stop(self, date, name, start, stop):
+        '''Move the running task to history'''
+        try:
+            self.append(date, name, start, stop)
+        except STORAGE_ERRORS as error:
+            LOGGER.error("Could not save report: %s", error)
+            return False
+
+        # Delete current task data to mark it as stopped
+        os.remove(self.task_path)
+        return True
+
+    def cancel(self):
+        '''Forget the running task, returns its data'''
+        if not self.is_running():
+            return None
+        with open(self.task_path, "r") as cfile:
+            content = cfile.read()
+        os.remove(self.task_path)
+        return content
+
+    def is_empty(self):
+        '''Check whether the history has no tasks'''
+        raise NotImplementedError
+
+    def append(self, date, name, start, stop):
+        '''Add a task to history'''
+        raise NotImplementedError
+
+    def history(self, since=None, until=None, tag=None, text=None):
+        '''Yield (tid, name, start, stop) strings of the tasks in history,
+        most recent first.
+
+        Tasks with the same name share the same integer ID, assigned from 1
+        in order of most recent use over the whole history. Storages can skip
+        the tasks not ended in [since, until), without a +tag/@context
+        starting by tag or without text in their name or end date.
+        '''
+        raise NotImplementedError
+
+    def totals(self, since=None, until=None, tag=None, text=None, daily=False):
+        '''Get (tid, name, start, stop, seconds) for each task name selected
+        as in history, or for each task name and end day if daily, where
+        start and stop are the ones of its most recent use and seconds its
+        total work time, or None if the storage cannot compute them itself'''
+        return None
+
+    def chunks(self, since=None, until=None, tag=None, text=None, count=1):
+        '''Get (path, start, end, needles) chunks of the history files holding
+        the tasks selected as in history, newest first, to be read with
+        reverse_fields. Chunks are about count, or None if the storage is not
+        made of files'''
+        return None
+
+    def ids(self):
+        '''Get the (tid, history name) of each sanitized task name, for the
+        tasks read from chunks'''
+        raise NotImplementedError
+
+    def name(self, tid):
+        '''Get the name of the task with ID tid as found in history, or None'''
+        for task_id, name, _, _ in self.history():
+            if task_id == tid:
+                return name
+        return None
+
+    def complete(self, prefix):
+        '''Get the tags, contexts or task names starting by prefix, most
+        recently used first'''
+        raise NotImplementedError
+
+    def rows(self):
+        '''Yield the fields of every history line, oldest first'''
+        raise NotImplementedError
+
+    def extend(self, rows):
+        '''Append history lines, as returned by rows'''
+        raise NotImplementedError
+
+    def merge(self, rows):
+        '''Add history lines, as returned by rows and in time order, among
+        the ones in history so that it stays in time order'''
+        raise NotImplementedError
+
+    def rebuild(self):
+        '''Rebuild the indexes and rollups of the history from scratch'''
+        raise NotImplementedError
+
+    def archive(self):
+        '''Compress the parts of history that cannot change anymore, returns
+        the paths of the archives made, or None if the storage has none'''
+        return None
+
+
+class CsvStorage(Storage):
+    '''History stored in the letsdo-data CSV file, with sidecar indexes'''
+    NAME = 'csv'
+    INDEXES = (DayIndex, TagIndex, Vocabulary, TaskTable, DailyRollup)
+
+    def __init__(self, configuration, data_path=None):
+        super(CsvStorage, self).__init__(configuration)
+        self.data_path = data_path or configuration.data_fullpath
+
+    def is_empty(self):
+        return not os.path.exists(self.data_path) or not os.path.getsize(self.data_path)
+
+    def append(self, date, name, start, stop):
+        report_line = "{date},{name},{start_time},{stop_time}\n".format(
+            date=date,
+            name=name,
+            start_time=start,
+            stop_time=stop,
+        )
+        before = signature(self.data_path)
+        with open(self.data_path, mode="a") as cfile:
+            cfile.writelines(report_line)
+
+        offset = before[1] if before else 0
+        for index in self.INDEXES:
+            index.update(self.data_path, before, offset, report_line)
+
+    def __ranges(self, since=None, until=None, tag=None):
+        # Sorted (start, end) offset ranges of the history lines that can
+        # match, end is None for the end of file
+        if not since and not until and not tag:
+            return [(0, None)]
+
+        index = DayIndex.load(self.data_path)
+        start = index.offset(since) if since else 0
+        end = index.offset(until) if until else index.size
+        # Backfilled lines are after the range of their day
+        late = index.late_ranges(since, until) if since or until else []
+        if not tag:
+            return _union([(start, end)] + late)
+
+        tag_days = TagIndex.load(self.data_path).days(tag)
+        return _union([
+            (max(first, start), min(last, end))
+            for first, last in index.ranges(tag_days)
+            if first < end and last > start
+        ] + late)
+
+    def history(self, since=None, until=None, tag=None, text=None):
+        # Task IDs depend on the newer tasks too, they come from the table
+        ids = self.ids()
+        for fields in self.fields(since, until, tag, text):
+            # Tasks with same UID share the same Task ID as well
+            # Integer IDs are easier to use than hash IDs
+            yield (ids[name_info(fields[0]).name][0],) + fields
+
+    def fields(self, since=None, until=None, tag=None, text=None):
+        '''Yield the (name, start, stop) strings of the tasks in the file,
+        most recent first, skipping the ones history can skip'''
+        for path, start, end, needles in self.chunks(since, until, tag, text):
+            for fields in reverse_fields(path, start, end, needles):
+                yield fields
+
+    def chunks(self, since=None, until=None, tag=None, text=None, count=1):
+        # The lines without the tag or text are skipped undecoded
+        needles = tuple(word.encode() for word in (tag, text) if word)
+        ranges = self.__ranges(since, until, tag)
+        if count > 1 and not is_archive(self.data_path):
+            size = os.path.getsize(self.data_path)
+            ranges = split_ranges(
+                self.data_path, [(start, size if end is None else end) for start, end in ranges],
+                count)
+        else:
+            # Archives are decompressed from their start for each chunk
+            ranges = reversed(ranges)
+        return [(self.data_path, start, end, needles) for start, end in ranges]
+
+    def ids(self):
+        return TaskTable.load(self.data_path).ids()
+
+    def totals(self, since=None, until=None, tag=None, text=None, daily=False):
+        # The lines of a single day are read faster than the rollups
+        if since and until and until - since <= timedelta(days=1):
+            return None
+        return DailyRollup.load(self.data_path).totals(
+            self.ids(),
+            since.strftime('%Y-%m-%d') if since else None,
+            until.strftime('%Y-%m-%d') if until else None,
+            tag, text, daily)
+
+    def name(self, tid):
+        return TaskTable.load(self.data_path).name(tid)
+
+    def complete(self, prefix):
+        return Vocabulary.load(self.data_path).complete(prefix)
+
+    def rows(self):
+        with open_history(self.data_path) as cfile:
+            for line in cfile:
+                if line.strip():
+                    fields = line.decode().strip().split(",")
+                    if len(fields) not in (4, 5):
+                        raise Exception(
+                            "History unexpected fields ({}: {})".format(len(fields), fields)
+                        )
+                    yield fields
+
+    def extend(self, rows):
+        # Indexes are rebuilt on next load
+        with open(self.data_path, mode="a") as cfile:
+            for fields in rows:
+                cfile.write(",".join(fields) + "\n")
+
+    def merge(self, rows):
+        lines = [",".join(fields) + "\n" for fields in rows]
+        if not lines:
+            return
+
+        if self.__appendable(_end_time(rows[0])):
+            text = "".join(lines)
+            before = signature(self.data_path)
+            with open(self.data_path, mode="a") as cfile:
+                cfile.write(text)
+            offset = before[1] if before else 0
+            for index in self.INDEXES:
+                index.update(self.data_path, before, offset, text)
+            return
+
+        # Older lines go in the middle: the history is written again, and
+        # the indexes are built on the way
+        indexes = [index(self.data_path) for index in self.INDEXES]
+        new = [(_end_time(fields), line.encode()) for fields, line in zip(rows, lines)]
+        temp_path = self.data_path + ".tmp"
+        offset = 0
+        with open(self.data_path, "rb") as old, open(temp_path, "wb") as cfile:
+            for line in _merge(self.__timed(old), new):
+                cfile.write(line)
+                for index in indexes:
+                    index.add(line, offset)
+                offset += len(line)
+        os.replace(temp_path, self.data_path)
+        for index in indexes:
+            index.signature = signature(self.data_path)
+            index.write()
+
+    def __appendable(self, end):
+        # Whether lines ending from end on can go after the last history line
+        last = next(reverse_lines(self.data_path), None) if not self.is_empty() else None
+        if last is None:
+            return True
+        try:
+            return end >= _end_time(last.split(","))
+        except ValueError:
+            return False
+
+    @staticmethod
+    def __timed(cfile):
+        # (end time, line) of the lines of the history file, the lines
+        # without an end time stay after the previous one
+        end = datetime.min
+        for line in cfile:
+            if not line.endswith(b"\n"):
+                line += b"\n"
+            try:
+                end = _end_time(line.decode().split(",")) if line.strip() else end
+            except ValueError:
+                pass
+            yield end, line
+
+    def rebuild(self):
+        for index in self.INDEXES:
+            index(self.data_path).rebuild()
+
+
+class SqliteStorage(Storage):
+    '''History stored in the letsdo-data.sqlite database.
+
+    Lines are stored with their raw name and legacy worked time, if any, so
+    that they can be exported back to CSV as they were. Names are indexed by
+    the uid of their sanitized form and by +tag/@context, stop times are
+    indexed for date range queries.
+    '''
+    NAME = 'sqlite'
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY,
+        date TEXT NOT NULL,
+        name TEXT NOT NULL,
+        uid TEXT NOT NULL,
+        worked TEXT,
+        start TEXT NOT NULL,
+        stop TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS history_stop ON history (stop);
+    CREATE INDEX IF NOT EXISTS history_uid ON history (uid);
+    CREATE TABLE IF NOT EXISTS names (
+        uid TEXT PRIMARY KEY,
+        name TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS tags (
+        tag TEXT NOT NULL,
+        history_id INTEGER NOT NULL REFERENCES history (id)
+    );
+    CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag, history_id);
+    '''
+
+    def __init__(self, configuration):
+        super(SqliteStorage, self).__init__(configuration)
+        self.data_path = configuration.data_fullpath + '.sqlite'
+        self.__connection = None
+
+    @property
+    def connection(self):
+        '''The database connection, opened on first use'''
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.data_path)
+            self.__connection.executescript(self.SCHEMA)
+        return self.__connection
+
+    def is_empty(self):
+        return not self.connection.execute('SELECT 1 FROM history LIMIT 1').fetchone()
+
+    def __insert(self, fields):
+        if len(fields) == 5:
+            date, name, worked, start, stop = fields
+        elif len(fields) == 4:
+            date, name, start, stop = fields
+            worked = None
+        else:
+            raise Exception("History unexpected fields ({}: {})".format(len(fields), fields))
+
+        info = name_info(name)
+        clean_name, uid = info.name, info.uid
+        # Times are stored in the canonical form, so they can be compared
+        start, stop = [
+            parse_history_datetime(time.strip()).strftime('%Y-%m-%d %H:%M')
+            for time in (start, stop)
+        ]
+        cursor = self.connection.execute(
+            'INSERT INTO history (date, name, uid, worked, start, stop) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (date, name, uid, worked, start, stop))
+        self.connection.execute(
+            'INSERT OR IGNORE INTO names (uid, name) VALUES (?, ?)', (uid, clean_name))
+        self.connection.executemany(
+            'INSERT INTO tags (tag, history_id) VALUES (?, ?)',
+            [(tag, cursor.lastrowid) for tag in set(TAGS_PATTERN.findall(clean_name))])
+
+    def append(self, date, name, start, stop):
+        with self.connection:
+            self.__insert([str(date), name, start, stop])
+
+    def __where(self, since=None, until=None, tag=None, text=None):
+        # SQL condition and parameters selecting the tasks that can match
+        conditions = ["history.name != ''"]
+        params = []
+        if since:
+            conditions.append('history.stop >= ?')
+            params.append(since.strftime('%Y-%m-%d'))
+        if until:
+            conditions.append('history.stop < ?')
+            params.append(until.strftime('%Y-%m-%d'))
+        if tag:
+            conditions.append(
+                'history.id IN (SELECT history_id FROM tags WHERE tag GLOB ?)')
+            params.append(_glob_prefix(tag))
+        if text:
+            conditions.append(
+                '(history.uid IN (SELECT uid FROM names WHERE instr(name, ?)) OR '
+                'instr(substr(history.stop, 1, 10), ?))')
+            params.extend([text, text])
+        return ' AND '.join(conditions), params
+
+    def __tids(self):
+        # Task IDs of all the uids, by most recent use
+        cursor = self.connection.execute(
+            "SELECT uid FROM history WHERE name != '' GROUP BY uid ORDER BY MAX(id) DESC")
+        return {uid: tid for tid, (uid,) in enumerate(cursor, 1)}
+
+    def history(self, since=None, until=None, tag=None, text=None):
+        tids = self.__tids()
+        where, params = self.__where(since, until, tag, text)
+        cursor = self.connection.execute(
+            'SELECT uid, name, start, stop FROM history WHERE %s ORDER BY id DESC' % where,
+            params)
+        for uid, name, start, stop in cursor:
+            yield tids[uid], name, start, stop
+
+    def name(self, tid):
+        if tid < 1:
+            return None
+        cursor = self.connection.execute(
+            "SELECT name FROM history WHERE id = (SELECT MAX(id) FROM history WHERE name != '' "
+            'GROUP BY uid ORDER BY MAX(id) DESC LIMIT 1 OFFSET ?)', (tid - 1,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def totals(self, since=None, until=None, tag=None, text=None, daily=False):
+        tids = self.__tids()
+        where, params = self.__where(since, until, tag, text)
+        group = 'substr(stop, 1, 10), uid' if daily else 'uid'
+        # Bare columns come from the row with MAX(id), the most recent one
+        cursor = self.connection.execute(
+            'SELECT uid, name, start, stop, MAX(id), '
+            "SUM(strftime('%%s', stop) - strftime('%%s', start)) "
+            'FROM history WHERE %s GROUP BY %s ORDER BY MAX(id) DESC' % (where, group),
+            params)
+        return [(tids[uid], name, start, stop, seconds)
+                for uid, name, start, stop, _, seconds in cursor]
+
+    def complete(self, prefix):
+        if prefix[:1] in ('+', '@'):
+            cursor = self.connection.execute(
+                'SELECT tag FROM tags WHERE tag GLOB ? '
+                'GROUP BY tag ORDER BY MAX(history_id) DESC', (_glob_prefix(prefix),))
+        else:
+            cursor = self.connection.execute(
+                'SELECT names.name FROM names JOIN history USING (uid) '
+                'WHERE names.name GLOB ? GROUP BY uid ORDER BY MAX(history.id) DESC '
+                'LIMIT ?', (_glob_prefix(prefix), Vocabulary.MAX_NAMES))
+        return [word for (word,) in cursor]
+
+    def rows(self):
+        cursor = self.connection.execute(
+            'SELECT date, name, worked, start, stop FROM history ORDER BY id')
+        for date, name, worked, start, stop in cursor:
+            if worked is None:
+                yield [date, name, start, stop]
+            else:
+                yield [date, name, worked, start, stop]
+
+    def extend(self, rows):
+        with self.connection:
+            for fields in rows:
+                self.__insert(fields)
+
+    def merge(self, rows):
+        with self.connection:
+            newest = self.connection.execute('SELECT MAX(stop) FROM history').fetchone()[0]
+            if rows and newest is not None and rows[0][-1] < newest:
+                # Lines are numbered in time order, the newer ones are
+                # inserted again after the older ones
+                old = list(self.connection.execute(
+                    'SELECT date, name, worked, start, stop FROM history '
+                    'WHERE stop > ? ORDER BY id', (rows[0][-1],)))
+                self.connection.execute(
+                    'DELETE FROM tags WHERE history_id IN '
+                    '(SELECT id FROM history WHERE stop > ?)', (rows[0][-1],))
+                self.connection.execute('DELETE FROM history WHERE stop > ?', (rows[0][-1],))
+                old = [[field for field in row if field is not None] for row in old]
+                rows = _merge([(_end_time(fields), fields) for fields in old],
+                              [(_end_time(fields), fields) for fields in rows])
+            for fields in rows:
+                self.__insert(fields)
+
+    def rebuild(self):
+        # Totals are computed by the database, only its indexes can be rebuilt
+        with self.connection:
+            self.connection.execute('REINDEX')
+
+
+class SegmentedStorage(Storage):
+    '''History split in yearly CSV files, by the year tasks ended in, in the
+    letsdo-data.d directory: letsdo-data.d/2019.csv, letsdo-data.d/2020.csv...
+
+    Each file is a csv storage of its own, with its sidecar indexes, and
+    queries only open the files of the years they can match. The files
+    before the last, live, one are closed: they are sealed with a Seal
+    summary, which the totals of the whole history are taken from. An
+    existing letsdo-data file is split on first use.
+
+    Closed files can be archived: compressed in place with lzma, as
+    letsdo-data.d/2019.csv.xz, or with gzip by hand. Archives are only
+    decompressed by the queries matching their year, and extracted back if
+    tasks are added to it.
+    '''
+    NAME = 'segments'
+    SEGMENT = re.compile(r'^(\d{4})\.csv(\.xz|\.gz)?$')
+    ARCHIVE_SUFFIX = '.xz'
+
+    def __init__(self, configuration):
+        super(SegmentedStorage, self).__init__(configuration)
+        self.configuration = configuration
+        self.data_path = configuration.data_fullpath + '.d'
+
+    def __segment(self, year):
+        return CsvStorage(self.configuration, os.path.join(self.data_path, '%d.csv' % year))
+
+    def __segments(self, split=True):
+        # (year, storage) of each segment, oldest first
+        source = CsvStorage(self.configuration)
+        if split and not os.path.isdir(self.data_path) and not source.is_empty():
+            LOGGER.warning('splitting "%s" in yearly files in "%s"',
+                           source.data_path, self.data_path)
+            self.extend(source.rows())
+        try:
+            names = os.listdir(self.data_path)
+        except OSError:
+            return []
+        paths = {}
+        for match in filter(None, map(self.SEGMENT.match, names)):
+            # A plain file wins over an archive of the same year
+            year = int(match.group(1))
+            if year not in paths or not match.group(2):
+                paths[year] = os.path.join(self.data_path, match.group(0))
+        return [(year, CsvStorage(self.configuration, paths[year])) for year in sorted(paths)]
+
+    def __writable(self, year):
+        # Storage of the plain file of year, extracting its archive if any
+        segment = self.__segment(year)
+        for suffix in ARCHIVES:
+            archive = segment.data_path + suffix
+            if not os.path.exists(archive):
+                continue
+            LOGGER.warning('extracting "%s" to add tasks to it', archive)
+            import shutil
+
+            with open_history(archive) as source, open(segment.data_path, 'ab') as target:
+                shutil.copyfileobj(source, target)
+            self.__remove(archive)
+        return segment
+
+    @staticmethod
+    def __remove(data_path):
+        # Remove a history file with its sidecar indexes
+        for index in CsvStorage.INDEXES + (Seal,):
+            if os.path.exists(data_path + index.SUFFIX):
+                os.remove(data_path + index.SUFFIX)
+        os.remove(data_path)
+
+    def __selected(self, since=None, until=None, tag=None):
+        # (year, storage, closed) of the segments that can hold tasks ended in
+        # [since, until) with tag, newest first
+        segments = self.__segments()
+        for year, segment in reversed(segments):
+            closed = year != segments[-1][0]
+            if since and since.year > year:
+                continue
+            if until and until <= datetime(year, 1, 1):
+                continue
+            if tag and closed and not Seal.load(segment.data_path).has_tag(tag):
+                continue
+            yield year, segment, closed
+
+    def ids(self):
+        # Task IDs are numbered across segments, newer ones first
+        ids = {}
+        for _, segment in reversed(self.__segments()):
+            table = TaskTable.load(segment.data_path).ids()
+            for name, (_, history_name) in sorted(table.items(), key=lambda item: item[1][0]):
+                if name not in ids:
+                    ids[name] = (len(ids) + 1, history_name)
+        return ids
+
+    def is_empty(self):
+        return all(segment.is_empty() for _, segment in self.__segments(split=False))
+
+    def append(self, date, name, start, stop):
+        self.merge([[str(date), name, start, stop]])
+
+    def history(self, since=None, until=None, tag=None, text=None):
+        ids = self.ids()
+        for _, segment, _ in self.__selected(since, until, tag):
+            for fields in segment.fields(since, until, tag, text):
+                yield (ids[name_info(fields[0]).name][0],) + fields
+
+    def chunks(self, since=None, until=None, tag=None, text=None, count=1):
+        chunks = []
+        for _, segment, _ in self.__selected(since, until, tag):
+            chunks.extend(segment.chunks(since, until, tag, text, count))
+        return chunks
+
+    def totals(self, since=None, until=None, tag=None, text=None, daily=False):
+        # The lines of a single day are read faster than the rollups
+        if since and until and until - since <= timedelta(days=1):
+            return None
+        ids = self.ids()
+        everything = not (since or until or tag or text or daily)
+        groups = {}
+        for _, segment, closed in self.__selected(since, until, tag):
+            if everything and closed:
+                totals = Seal.load(segment.data_path).totals(ids)
+            else:
+                totals = DailyRollup.load(segment.data_path).totals(
+                    ids,
+                    since.strftime('%Y-%m-%d') if since else None,
+                    until.strftime('%Y-%m-%d') if until else None,
+                    tag, text, daily)
+            # Segments come newest first, so do the tasks in each segment
+            for tid, name, start, stop, seconds in totals:
+                key = (tid, stop[:10]) if daily else tid
+                group = groups.get(key)
+                if group is None:
+                    groups[key] = [tid, name, start, stop, seconds]
+                else:
+                    group[4] += seconds
+        return [tuple(group) for group in groups.values()]
+
+    def name(self, tid):
+        ids = list(self.ids().values())
+        if 0 < tid <= len(ids):
+            return ids[tid - 1][1]
+        return None
+
+    def complete(self, prefix):
+        words = []
+        for _, segment in reversed(self.__segments()):
+            words.extend(word for word in segment.complete(prefix) if word not in words)
+        return words
+
+    def rows(self):
+        for _, segment in self.__segments():
+            for fields in segment.rows():
+                yield fields
+
+    def extend(self, rows):
+        # Indexes are rebuilt on next load
+        os.makedirs(self.data_path, exist_ok=True)
+        files = {}
+        year = None
+        try:
+            for fields in rows:
+                try:
+                    year = _end_time(fields).year
+                except ValueError:
+                    # Lines without an end time stay with the previous one
+                    if year is None:
+                        raise
+                if year not in files:
+                    files[year] = open(self.__writable(year).data_path, mode="a")
+                files[year].write(",".join(fields) + "\n")
+        finally:
+            for cfile in files.values():
+                cfile.close()
+
+    def merge(self, rows):
+        self.__segments()
+        years = {}
+        for fields in rows:
+            years.setdefault(_end_time(fields).year, []).append(fields)
+        os.makedirs(self.data_path, exist_ok=True)
+        for year in sorted(years):
+            self.__writable(year).merge(years[year])
+
+    def rebuild(self):
+        segments = self.__segments()
+        for year, segment in segments:
+            segment.rebuild()
+            if year != segments[-1][0]:
+                Seal(segment.data_path).rebuild()
+
+    def archive(self):
+        # Only archiving compresses history, other commands do not need them
+        import lzma
+        import shutil
+
+        archives = []
+        for _, segment in self.__segments()[:-1]:
+            if is_archive(segment.data_path):
+                continue
+            archive = segment.data_path + self.ARCHIVE_SUFFIX
+            temp_path = archive + ".tmp"
+            with open(segment.data_path, "rb") as source, lzma.open(temp_path, "wb") as cfile:
+                shutil.copyfileobj(source, cfile)
+            os.replace(temp_path, archive)
+            # Offsets in the decompressed archive are the ones in the file
+            for index in CsvStorage.INDEXES + (Seal,):
+                index.load(segment.data_path).move(archive)
+            self.__remove(segment.data_path)
+            archives.append(archive)
+        return archives
+
+
+# Errors storages can raise reading or writing history, archives raise
+# ArchiveError (an IOError) when they cannot be decompressed
+STORAGE_ERRORS = (IOError, EOFError, sqlite3.Error)
+
+STORAGES = {storage.NAME: storage for storage in (CsvStorage, SqliteStorage, SegmentedStorage)}
+
+_STORAGE = None
+
+
+def get_storage():
+    '''Get the storage selected by the STORAGE configuration key'''
+    global _STORAGE
+    configuration = get_configuration()
+    kind = STORAGES.get(configuration.storage, CsvStorage)
+    if (_STORAGE is None or type(_STORAGE) is not kind or
+            _STORAGE.data_directory != configuration.data_directory):
+        _STORAGE = kind(configuration)
+    return _STORAGE
+
+
+def migrate(target):
+    '''Copy the history from the current storage to the target one, and
+    select the target one in configuration'''
+    source = get_storage()
+    if source.NAME == target:
+        LOGGER.warning('history is already stored in %s', target)
+        return False
+
+    destination = STORAGES[target](get_configuration())
+    if not destination.is_empty():
+        LOGGER.error('%s history in "%s" is not empty', target, destination.data_path)
+        return False
+
+    destination.extend(source.rows())
+    get_configuration().storage = target
+    return True
@@ -0,0 +1,124 @@
+'''
+Tables printed row by row, in the look of terminaltables
+'''
+from itertools import chain, islice
+from terminaltables.width_and_alignment import visible_width
+
+# Rows measured to size the columns before the first one is printed
+SAMPLE_ROWS = 1000
+
+
+def _cut(line, width):
+    # Index of the first character past width columns, at least 1
+    columns = 0
+    for index, char in enumerate(line):
+        columns += visible_width(char)
+        if columns > width:
+            return max(index, 1)
+    return len(line)
+
+
+def wrap(text, width):
+    '''Split the lines of text wider than width, at a space if possible'''
+    lines = []
+    for line in str(text).splitlines() or ['']:
+        while visible_width(line) > width:
+            cut = _cut(line, width)
+            space = line.rfind(' ', 1, cut + 1)
+            if space > 0:
+                cut = space
+            lines.append(line[:cut])
+            line = line[cut:]
+        lines.append(line)
+    return lines
+
+
+class StreamingTable(object):
+    '''Print the rows of a terminaltables table as they come.
+
+    terminaltables measures the whole table before printing its first line.
+    Here the columns fit the heading, the footer, the widths budgets and the
+    first SAMPLE_ROWS rows only. A later cell that does not fit its column is
+    wrapped on more lines. Tables within the sample look exactly as
+    terminaltables prints them.
+
+    table is the terminaltables table giving the look: borders, title and
+    column justification. heading and footer are ready to print, rows are
+    plain text cells which are colorized by paint.
+    '''
+    def __init__(self, table, heading, footer, widths=None, paint=None, sample=SAMPLE_ROWS):
+        self.table = table
+        self.heading = heading
+        self.footer = footer
+        self.widths = list(widths or [])
+        self.paint = paint or (lambda cell: cell)
+        self.sample = sample
+
+    def __measure(self, rows):
+        widths = self.widths + [0] * (len(self.heading) - len(self.widths))
+        for row in chain([self.heading, self.footer], rows):
+            for column, cell in enumerate(row):
+                cell = str(cell)
+                if cell:
+                    widths[column] = max(
+                        widths[column], *[visible_width(line) for line in cell.splitlines()])
+        return widths
+
+    def __fit(self, row, widths):
+        # Colorize the cells, wrapping the ones wider than their column
+        cells = []
+        for cell, width in zip(row, widths):
+            plain = str(cell)
+            if all(visible_width(line) <= width for line in plain.splitlines()):
+                cells.append(self.paint(cell))
+            else:
+                cells.append('\n'.join(self.paint(line) for line in wrap(plain, width)))
+        return cells
+
+    def __row_lines(self, row, style, widths):
+        height = 0
+        for cell in row:
+            cell = str(cell)
+            if cell:
+                height = max(height, cell.count('\n') + 1)
+        # The parts of a line are lazy on the row line index, take them now
+        for line in self.table.gen_row_lines(row, style, widths, height):
+            yield list(line)
+
+    def lines(self, rows):
+        '''Yield the lines of the table, printing rows as they come'''
+        rows = iter(rows)
+        sample = list(islice(rows, self.sample))
+        widths = self.__measure(sample)
+        outer_widths = [self.table.padding_left + width + self.table.padding_right
+                        for width in widths]
+
+        def border(style):
+            return self.table.horizontal_border(style, outer_widths)
+
+        parts = []
+        if self.table.outer_border:
+            parts.append(border('top'))
+        parts.extend(self.__row_lines(self.heading, 'heading', widths))
+        if self.table.inner_heading_row_border:
+            parts.append(border('heading'))
+        for index, row in enumerate(chain(sample, rows)):
+            if index and self.table.inner_row_border:
+                parts.append(border('row'))
+            parts.extend(self.__row_lines(self.__fit(row, widths), 'row', widths))
+            for part in parts:
+                yield self.__join(part)
+            parts = []
+        if self.table.inner_footing_row_border:
+            parts.append(border('footing'))
+        parts.extend(self.__row_lines(self.footer, 'footing', widths))
+        if self.table.outer_border:
+            parts.append(border('bottom'))
+        for part in parts:
+            yield self.__join(part)
+
+    @staticmethod
+    def __join(part):
+        # As UnixTable does, skip switching the line drawing charset off and
+        # on again between adjacent border characters
+        return ''.join(part).replace('\033(B\033(0', '')
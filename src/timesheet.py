@@ -0,0 +1,96 @@
+'''
+Timesheets to import in history: CSV files with a header row, or NDJSON
+files with one JSON object per line
+'''
+import csv
+import json
+import re
+from datetime import datetime
+
+# Fields of a timesheet entry, a date completes start and stop times without one
+FIELDS = ("name", "start", "stop")
+DATE_FIELD = "date"
+
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl", ".json")
+
+# Times are full timestamps, or clock times on the day of the date field
+TIMESTAMP = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}$")
+CLOCK = re.compile(r"^\d{1,2}:\d{2}$")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def _csv_entries(tfile):
+    reader = csv.DictReader(tfile)
+    if reader.fieldnames:
+        reader.fieldnames = [field.strip().lower() for field in reader.fieldnames]
+        missing = [field for field in FIELDS if field not in reader.fieldnames]
+        if missing:
+            raise ValueError("missing columns: %s" % ", ".join(missing))
+    for entry in reader:
+        yield reader.line_num, entry
+
+
+def _ndjson_entries(tfile):
+    for number, line in enumerate(tfile, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError as error:
+            raise ValueError("line %d: %s" % (number, error))
+        if not isinstance(entry, dict):
+            raise ValueError("line %d: not a JSON object" % number)
+        yield number, {str(key).lower(): value for key, value in entry.items()}
+
+
+def _time(entry, field):
+    value = str(entry.get(field) or "").strip()
+    if not value:
+        raise ValueError("no %s time" % field)
+    date = str(entry.get(DATE_FIELD) or "").strip()
+    if date and CLOCK.match(value):
+        value = "%s %s" % (date, value.zfill(len("00:00")))
+    if TIMESTAMP.match(value):
+        try:
+            return datetime.strptime(value, TIMESTAMP_FORMAT)
+        except ValueError:
+            pass
+    raise ValueError("%s time '%s' is not YYYY-MM-DD HH:MM, or HH:MM with a %s" % (
+        field, value, DATE_FIELD))
+
+
+def history_row(entry):
+    """Get the history line fields of a timesheet entry, in the stored format"""
+    # As in Task, commas separate the fields of history lines
+    name = " ".join(str(entry.get("name") or "").replace(",", " ").splitlines()).strip()
+    if not name:
+        raise ValueError("no task name")
+    start, stop = _time(entry, "start"), _time(entry, "stop")
+    if stop < start:
+        raise ValueError("stop time %s is before start time %s" % (stop, start))
+    return [
+        stop.strftime("%Y-%m-%d"),
+        name,
+        start.strftime("%Y-%m-%d %H:%M"),
+        stop.strftime("%Y-%m-%d %H:%M"),
+    ]
+
+
+def read_timesheet(path):
+    """Get the history line fields of the entries of the timesheet at path,
+    in time order.
+
+    Files ending by one of NDJSON_EXTENSIONS are read as NDJSON, anything
+    else as CSV. Raises ValueError telling the first invalid entry.
+    """
+    entries = _ndjson_entries if path.lower().endswith(NDJSON_EXTENSIONS) else _csv_entries
+    rows = []
+    with open(path, newline="") as tfile:
+        for number, entry in entries(tfile):
+            try:
+                rows.append(history_row(entry))
+            except ValueError as error:
+                raise ValueError("line %d: %s" % (number, error))
+    # Stored times sort as strings, ties keep the timesheet order
+    rows.sort(key=lambda fields: (fields[3], fields[2]))
+    return rows
@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta
+from functools import lru_cache
 import re
 from string import Formatter
-import parsedatetime as pdt
 
 def strfdelta(tdelta, fmt='{H:2}h {M:02}m', inputtype='timedelta'):
     """Convert a datetime.timedelta object or a regular number to a custom-
@@ -57,100 +57,85 @@ def format_h_m(string):
     return '{0}h {1}m'.format(hours, minutes)
 
 
-def str2datetime(string):
-    #if string == 'yesterday':
-    #    return = datetime.now() - timedelta(1)
-
-    m = re.findall(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        return datetime.strptime(string, '%Y-%m-%d %H:%M')
-
-    m = re.findall(r'\d{4}-\d{2}-\d{2} \d{2}.\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        return datetime.strptime(string, '%Y-%m-%d %H.%M')
-
-    m = re.findall(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        return datetime.strptime(string, '%Y/%m/%d %H:%M')
-
-    m = re.findall(r'\d{4}/\d{2}/\d{2} \d{2}.\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        return datetime.strptime(string, '%Y/%m/%d %H.%M')
-
-    m = re.findall(r'\d{4}-\d{2}-\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        now_str = datetime.now().strftime('%H:%M')
-        return datetime.strptime(string + ' ' + now_str,
-                                          '%Y-%m-%d %H:%M')
-
-    m = re.findall(r'\d{4}/\d{2}/\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        now_str = datetime.now().strftime('%H:%M')
-        return datetime.strptime(string + ' ' + now_str,
-                                          '%Y/%m/%d %H:%M')
-
-    m = re.findall(r'\d{2}-\d{2} \d{2}:\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        year_str = datetime.today().strftime('%Y')
-        return datetime.strptime(year_str + '-' + string,
-                                          '%Y-%m-%d %H:%M')
-
-    m = re.findall(r'\d{2}-\d{2} \d{2}.\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        year_str = datetime.today().strftime('%Y')
-        return datetime.strptime(year_str + '-' + string,
-                                          '%Y-%m-%d %H:%M')
-
-    m = re.findall(r'\d{2}-\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        year_str = datetime.today().strftime('%Y')
-        now_str = datetime.now().strftime('%H:%M')
-        return datetime.strptime(
-            year_str + '-' + string + ' ' + now_str, '%Y-%m-%d %H:%M')
-
-    m = re.findall(r'\d{2}:\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        today_str = datetime.today().strftime('%Y-%m-%d')
-        return datetime.strptime(today_str + ' ' + string,
-                                          '%Y-%m-%d %H:%M')
-
-    m = re.findall(r'\d:\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        today_str = datetime.today().strftime('%Y-%m-%d')
-        return datetime.strptime(today_str + ' ' + string,
-                                          '%Y-%m-%d %H:%M')
-
-    m = re.findall(r'\d{2}.\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        today_str = datetime.today().strftime('%Y-%m-%d')
-        return datetime.strptime(today_str + ' ' + string,
-                                          '%Y-%m-%d %H.%M')
-
-    m = re.findall(r'\d.\d{2}', string)
-    if len(m) != 0:
-        string = m[0]
-        today_str = datetime.today().strftime('%Y-%m-%d')
-        return datetime.strptime(today_str + ' ' + string,
-                                          '%Y-%m-%d %H.%M')
-
-    cal = pdt.Calendar()
-    res, ok = cal.parseDT(string, datetime.now())
-    if ok:
-        return res
+def parse_history_datetime(string):
+    """Convert a timestamp as stored in history (YYYY-MM-DD HH:MM) to datetime.
 
-    raise ValueError('Date format not recognized: %s' % string)
+    The fixed layout is sliced without regular expressions, anything else
+    falls back to str2datetime.
+    """
+    if (len(string) == 16 and string[4] == '-' and string[7] == '-' and
+            string[10] == ' ' and string[13] == ':'):
+        try:
+            return datetime(int(string[0:4]), int(string[5:7]), int(string[8:10]),
+                            int(string[11:13]), int(string[14:16]))
+        except ValueError:
+            pass
+    return str2datetime(string)
+
+
+# Formats recognized by str2datetime, in order of precedence.
+# Each entry is (pattern, prefix, suffix, format): the first match of pattern
+# is completed with the current time formatted by prefix and suffix, then
+# parsed with format.
+DATETIME_FORMATS = (
+    (re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}'), '', '', '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d{4}-\d{2}-\d{2} \d{2}.\d{2}'), '', '', '%Y-%m-%d %H.%M'),
+    (re.compile(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}'), '', '', '%Y/%m/%d %H:%M'),
+    (re.compile(r'\d{4}/\d{2}/\d{2} \d{2}.\d{2}'), '', '', '%Y/%m/%d %H.%M'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}'), '', ' %H:%M', '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d{4}/\d{2}/\d{2}'), '', ' %H:%M', '%Y/%m/%d %H:%M'),
+    (re.compile(r'\d{2}-\d{2} \d{2}:\d{2}'), '%Y-', '', '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d{2}-\d{2} \d{2}.\d{2}'), '%Y-', '', '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d{2}-\d{2}'), '%Y-', ' %H:%M', '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d{2}:\d{2}'), '%Y-%m-%d ', '', '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d:\d{2}'), '%Y-%m-%d ', '', '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d{2}.\d{2}'), '%Y-%m-%d ', '', '%Y-%m-%d %H.%M'),
+    (re.compile(r'\d.\d{2}'), '%Y-%m-%d ', '', '%Y-%m-%d %H.%M'),
+)
+
+# Relative days, resolved as parsedatetime does (at 9:00) without importing it
+RELATIVE_DAYS = {'yesterday': -1, 'today': 0, 'tomorrow': 1}
+
+_CALENDAR = None
+
+
+def _calendar():
+    """Get the parsedatetime Calendar, imported and built on first use"""
+    global _CALENDAR
+    if _CALENDAR is None:
+        import parsedatetime as pdt
+
+        _CALENDAR = pdt.Calendar()
+    return _CALENDAR
 
 
+def str2datetime(string):
+    """Convert a user provided date and/or time, absolute (see DATETIME_FORMATS)
+    or relative (e.g. 'yesterday', '10 minutes ago'), to datetime.
 
+    Missing parts are taken from the current time, at minute resolution, so
+    results are cached per string and current minute.
+    """
+    now = datetime.now().replace(second=0, microsecond=0)
+    value = _str2datetime(string, now)
+    if value is None:
+        raise ValueError('Date format not recognized: %s' % string)
+    return value
+
+
+@lru_cache(maxsize=256)
+def _str2datetime(string, now):
+    for pattern, prefix, suffix, format in DATETIME_FORMATS:
+        match = pattern.search(string)
+        if match:
+            string = now.strftime(prefix) + match.group(0) + now.strftime(suffix)
+            return datetime.strptime(string, format)
+
+    days = RELATIVE_DAYS.get(string.strip().lower())
+    if days is not None:
+        return now.replace(hour=9, minute=0) + timedelta(days=days)
+
+    res, ok = _calendar().parseDT(string, now)
+    if ok:
+        return res
+    return None
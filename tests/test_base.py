@@ -2,15 +2,41 @@
 # -*- coding: utf-8 -*-
 '''Tests for letsdo'''
 import unittest
+import gzip
+import lzma
 import os
+import shutil
+import subprocess
+import sys
+from glob import glob
 from time import sleep
+from unittest import mock
 from datetime import datetime, timedelta
 from ..src.letsdo import Task
 from ..src.letsdo import Configuration
+from ..src.configuration import load_flat
 from ..src.letsdo import work_on
 from ..src.letsdo import str2datetime
+from ..src.letsdo import parse_history_datetime
 from ..src.letsdo import group_task_by
 from ..src.letsdo import get_tasks
+from ..src.letsdo import iter_tasks
+from ..src.letsdo import aggregate
+from ..src.letsdo import get_configuration
+from ..src.letsdo import reverse_lines
+from ..src.letsdo import DayIndex
+from ..src.letsdo import TagIndex
+from ..src.letsdo import Vocabulary
+from ..src.history import NameTable, Seal, TaskTable
+from ..src.letsdo import NAMES
+from ..src.letsdo import get_storage
+from ..src.letsdo import get_task_totals
+from ..src.letsdo import migrate
+from ..src.letsdo import _p, _paint, painter
+from ..src.table import StreamingTable
+from ..src.query import compile_query
+from ..src.timesheet import read_timesheet
+from ..src.parallel import split_ranges
 
 
 class TestLetsdo(unittest.TestCase):
@@ -43,6 +69,11 @@ class TestLetsdo(unittest.TestCase):
             os.rename(self.user_conf_bak, self.test_conf_file)
         if os.path.exists(self.conf.data_fullpath):
             os.remove(self.conf.data_fullpath)
+        for sidecar in glob(self.conf.data_fullpath + '.*'):
+            if os.path.isdir(sidecar):
+                shutil.rmtree(sidecar)
+            else:
+                os.remove(sidecar)
         if os.path.exists(self.conf.task_fullpath):
             os.remove(self.conf.task_fullpath)
 
@@ -64,6 +95,185 @@ class TestLetsdo(unittest.TestCase):
         self.assertEqual(real[1].name, 'group 2')
         self.assertEqual(real[1].work_time, timedelta(minutes=1))
 
+    def test_aggregate(self):
+        '''test aggregate by several keys'''
+        tasks = [
+            Task('long +a +b', '2019-01-02 08:00', '2019-01-03 10:00', tid=1),
+            Task('short +a @home', '2019-01-02 10:00', '2019-01-02 10:30', tid=2),
+            Task('long +a +b', '2019-01-01 08:00', '2019-01-01 09:00', tid=1),
+        ]
+        by_name = aggregate(tasks, ('name',))
+        self.assertEqual(list(by_name.keys()), [('long +a +b',), ('short +a @home',)])
+        self.assertEqual(by_name[('long +a +b',)].work_time, timedelta(days=1, hours=3))
+        self.assertEqual(by_name[('long +a +b',)].count, 2)
+        self.assertEqual(by_name[('long +a +b',)].first_seen, datetime(2019, 1, 1, 8, 0))
+        self.assertEqual(by_name[('long +a +b',)].last_seen, datetime(2019, 1, 3, 10, 0))
+
+        by_tag = aggregate(tasks, ('month', 'tag'))
+        self.assertEqual(by_tag[('2019-01', '+a')].count, 3)
+        self.assertEqual(by_tag[('2019-01', '+b')].work_time, timedelta(days=1, hours=3))
+        self.assertEqual(aggregate(tasks, ('context',))[('@home',)].tid, 2)
+
+    def test_configuration_is_cached(self):
+        '''test configuration is loaded once and never written on read'''
+        conf = get_configuration()
+        mtime = os.stat(conf.conf_file_path).st_mtime_ns
+        self.assertIs(conf, get_configuration())
+        self.assertEqual(mtime, os.stat(conf.conf_file_path).st_mtime_ns)
+
+        with open(conf.conf_file_path, 'w') as fconf:
+            fconf.write('COLOR_ENABLED: false\nDATA_DIRECTORY: ~/\n')
+        os.utime(conf.conf_file_path, ns=(0, 0))
+        self.assertIs(get_configuration(), conf)
+        self.assertFalse(conf.color_enabled)
+
+    def test_reverse_lines(self):
+        '''test reverse_lines across block boundaries'''
+        lines = ['line %d %s' % (i, 'x' * i) for i in range(20)]
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('\n'.join(lines) + '\n\n')
+        real = list(reverse_lines(self.conf.data_fullpath, block_size=7))
+        self.assertEqual(real, list(reversed(lines)))
+
+    def test_reverse_lines_needles(self):
+        '''test reverse_lines skips the lines without the needles'''
+        lines = ['%d,task %d +t%d' % (i, i, i % 3) for i in range(30)]
+        lines.append('30,[doc](http://x) +t1')
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('\n'.join(lines) + '\n')
+        real = list(reverse_lines(self.conf.data_fullpath, block_size=16, needles=(b'+t2',)))
+        self.assertEqual(real, [lines[30]] + [line for line in reversed(lines) if '+t2' in line])
+        real = list(reverse_lines(self.conf.data_fullpath, needles=(b'+t1', b'task 2')))
+        self.assertEqual(real, [lines[30], lines[28], lines[25], lines[22]])
+
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,[doc](url)ument,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-02,other,2019-01-02 10:00,2019-01-02 11:00\n')
+        self.assertEqual([task.name for task in get_tasks(text='document')], ['document'])
+        self.assertEqual([task.name for task in get_tasks(text='01-01')], ['document'])
+
+    def test_iter_tasks(self):
+        '''test iter_tasks parses the history as the tasks are consumed'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,old,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-02,new,2019-01-02 10:00,2019-01-02 11:00\n')
+        tasks = iter_tasks()
+        self.assertEqual(next(tasks).name, 'new')
+        self.assertEqual([task.name for task in tasks], ['old'])
+        self.assertEqual([task.name for task in iter_tasks(lambda task: task.tid == 2)], ['old'])
+        self.assertEqual([task.name for task in get_tasks()], ['new', 'old'])
+
+    def test_history_record(self):
+        '''test history records read as the tasks they stand for'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,- fix +a +b @home,2019-01-01 10:00,2019-01-01 11:30\n')
+            fdata.write('2019-01-02,read,2019-01-01 23:00,2019-01-02 00:10\n')
+            fdata.write('2019-01-03,fix +a +b @home,2019-01-03 10:00,2019-01-03 10:05\n')
+        tasks = get_tasks()
+        expected = [
+            Task(' fix +a +b @home', '2019-01-03 10:00', '2019-01-03 10:05', tid=1),
+            Task('read', '2019-01-01 23:00', '2019-01-02 00:10', tid=2),
+            Task(' fix +a +b @home', '2019-01-01 10:00', '2019-01-01 11:30', tid=1),
+        ]
+        attributes = ('tid', 'name', 'start_time', 'end_time', 'work_time', 'last_end_date',
+                      'week_no', 'tags', 'context', 'uid')
+        self.assertEqual([[getattr(task, name) for name in attributes] for task in tasks],
+                         [[getattr(task, name) for name in attributes] for task in expected])
+        self.assertFalse(hasattr(tasks[0], '__dict__'))
+        self.assertIs(tasks[0].name, tasks[2].name)
+
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual([task.tid for task in tasks[1:]], [2, 1])
+        tasks.reverse()
+        self.assertEqual([task.end_time.day for task in tasks], [1, 2, 3])
+
+    def test_name_table(self):
+        '''test each distinct name of history is sanitized, parsed and hashed once'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,2019-01-01 [fix](http://x) +a @home,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-02,read,2019-01-02 10:00,2019-01-02 11:00\n')
+            fdata.write('2019-01-03,2019-01-01 [fix](http://x) +a @home,2019-01-03 10:00,2019-01-03 11:00\n')
+        get_tasks()
+        NAMES.clear()
+        tasks = get_tasks()
+        hits = NAMES.hits
+        self.assertEqual(NAMES.misses, 2)
+        self.assertIs(tasks[0].info, tasks[2].info)
+        get_tasks()
+        self.assertEqual((NAMES.hits, NAMES.misses), (2 * hits + 2, 2))
+
+        info, task = tasks[0].info, Task('fix +a @home')
+        self.assertEqual([info.name, info.context, info.tags, info.uid],
+                         [task.name, task.context, task.tags, task.uid])
+
+        table = NameTable(size=1)
+        self.assertIs(table.lookup('read'), table.lookup('read'))
+        table.lookup('fix')
+        self.assertEqual(list(table.infos), ['fix'])
+        self.assertEqual(table.counters(), {'hits': 1, 'misses': 2})
+
+    def test_get_tasks_out_of_order(self):
+        '''test a task stopped in the past does not hide the newer ones'''
+        Task('today one').start()
+        Task.stop()
+        Task('old', start_str='2019-03-04 10:00').start()
+        Task.stop('2019-03-04 11:00')
+        for query, names in (('today', ['today one']), ('2019-03-04', ['old']),
+                             ('', ['old', 'today one'])):
+            plan = compile_query(query)
+            tasks = get_tasks(plan.matches, **plan.selection)
+            self.assertEqual([task.name for task in tasks], names)
+
+    def test_get_tasks_range(self):
+        '''test get_tasks only parses the requested days'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,old,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-02,new,2019-01-02 10:00,2019-01-02 11:00\n')
+            fdata.write('2019-01-03,old,2019-01-03 10:00,2019-01-03 11:00\n')
+        tasks = get_tasks(since=datetime(2019, 1, 2))
+        self.assertEqual([task.name for task in tasks], ['old', 'new'])
+        self.assertEqual([task.tid for task in tasks], [1, 2])
+
+        tasks = get_tasks(since=datetime(2019, 1, 1), until=datetime(2019, 1, 3))
+        self.assertEqual([task.name for task in tasks], ['new', 'old'])
+        self.assertEqual([task.tid for task in tasks], [2, 1])
+
+    def test_day_index_update(self):
+        '''test the day index follows the history'''
+        Task('first', start_str='2019-01-01 10:00').start()
+        Task.stop('2019-01-01 11:00')
+        self.assertEqual(len(get_tasks(since=datetime(2019, 1, 1))), 1)
+
+        Task('second', start_str='2019-01-02 10:00').start()
+        Task.stop('2019-01-02 11:00')
+        index = DayIndex.load(self.conf.data_fullpath)
+        self.assertEqual(index.days, ['2019-01-01', '2019-01-02'])
+        self.assertEqual(index.offset(datetime(2019, 1, 2)),
+                         len(open(self.conf.data_fullpath).readline()))
+
+    def test_day_index_backfill(self):
+        '''test tasks stopped in the past are read on their own day'''
+        Task('recent +a', start_str='2019-03-10 10:00').start()
+        Task.stop('2019-03-10 11:00')
+        Task('backfilled +a', start_str='2019-03-04 10:00').start()
+        Task.stop('2019-03-04 11:00')
+        Task('newest', start_str='2019-03-11 10:00').start()
+        Task.stop('2019-03-11 11:00')
+
+        for kwargs in (dict(since=datetime(2019, 3, 4), until=datetime(2019, 3, 5)),
+                       dict(since=datetime(2019, 3, 1), until=datetime(2019, 3, 5), tag='+a')):
+            names = [task.name for task in get_tasks(compile_query('2019-03-04').matches,
+                                                     **kwargs)]
+            self.assertEqual(names, ['backfilled +a'])
+        names = [task.name for task in get_tasks(compile_query('2019-03').matches,
+                                                 **compile_query('2019-03').selection)]
+        self.assertEqual(names, ['newest', 'backfilled +a', 'recent +a'])
+
+        index = DayIndex.load(self.conf.data_fullpath)
+        self.assertEqual([day for day, _, _ in index.late], ['2019-03-04'])
+        os.remove(index.path)
+        self.assertEqual(DayIndex.load(self.conf.data_fullpath).late, index.late)
+
     def test_str2datetime(self):
         '''test str2datetime'''
         string = '2016-11-10 19:02'
@@ -124,6 +334,449 @@ class TestLetsdo(unittest.TestCase):
         value = str2datetime(string)
         self.assertEqual(value, expected_datetime)
 
+    def test_str2datetime_cache(self):
+        '''test str2datetime results are cached per string and current minute'''
+        class Clock(datetime):
+            current = None
+
+            @classmethod
+            def now(cls, tz=None):
+                return cls.current
+
+        with mock.patch.dict(str2datetime.__globals__, datetime=Clock):
+            Clock.current = Clock(2019, 1, 1, 23, 59, 10)
+            value = str2datetime('10:00')
+            self.assertEqual(value, datetime(2019, 1, 1, 10, 0))
+            self.assertEqual(str2datetime('yesterday'), datetime(2018, 12, 31, 9, 0))
+
+            Clock.current = Clock(2019, 1, 1, 23, 59, 50)
+            self.assertIs(str2datetime('10:00'), value)
+
+            Clock.current = Clock(2019, 1, 2, 0, 0, 5)
+            self.assertEqual(str2datetime('10:00'), datetime(2019, 1, 2, 10, 0))
+            self.assertEqual(str2datetime('yesterday'), datetime(2019, 1, 1, 9, 0))
+            self.assertEqual(str2datetime('2019-03-01'), datetime(2019, 3, 1, 0, 0))
+
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    str2datetime('no date here')
+
+    def test_get_tasks_by_tag(self):
+        '''test get_tasks only parses the days using a tag'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,a +tag,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-02,b +tags @home,2019-01-02 10:00,2019-01-02 11:00\n')
+            fdata.write('2019-01-03,c @home,2019-01-03 10:00,2019-01-03 11:00\n')
+        Task('d +tag', start_str='2019-01-04 10:00').start()
+        Task.stop('2019-01-04 11:00')
+
+        index = TagIndex.load(self.conf.data_fullpath)
+        self.assertEqual(index.days('+tags'), {'2019-01-02'})
+        self.assertEqual(index.days('+tag'), {'2019-01-01', '2019-01-02', '2019-01-04'})
+        self.assertEqual(index.days('@home'), {'2019-01-02', '2019-01-03'})
+
+        tasks = get_tasks(tag='@home')
+        self.assertEqual([(task.name, task.tid) for task in tasks],
+                         [('c @home', 2), ('b +tags @home', 3)])
+
+    def test_vocabulary(self):
+        '''test the completion vocabulary follows the history'''
+        for name in ['a +old', 'b +new @home', 'a +old']:
+            Task(name, start_str='2019-01-01 10:00').start()
+            Task.stop('2019-01-01 11:00')
+
+        vocabulary = Vocabulary.load(self.conf.data_fullpath)
+        self.assertEqual(vocabulary.complete('+'), ['+old', '+new'])
+        self.assertEqual(vocabulary.complete('@h'), ['@home'])
+        self.assertEqual(vocabulary.complete(''), ['a +old', 'b +new @home'])
+        self.assertEqual(vocabulary.names['a +old'][0], 2)
+
+    def test_task_table(self):
+        '''test task IDs are looked up in the task table, most recent first'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,- a,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-02,b,2019-01-02 10:00,2019-01-02 11:00\n')
+            fdata.write('2019-01-03,a,2019-01-03 10:00,2019-01-03 11:00\n')
+        self.assertEqual([get_storage().name(tid) for tid in range(4)], [None, 'a', 'b', None])
+
+        Task('b', start_str='2019-01-04 10:00').start()
+        Task.stop('2019-01-04 11:00')
+        table = TaskTable.load(self.conf.data_fullpath)
+        self.assertEqual(table.signature[1], os.path.getsize(self.conf.data_fullpath))
+        self.assertEqual(table.ids(), {'b': (1, 'b'), 'a': (2, 'a')})
+        self.assertEqual([task.tid for task in get_tasks()], [1, 2, 1, 2])
+
+        work_on(task_id=2)
+        self.assertEqual(Task.get_running().name, 'a')
+
+    def test_sqlite_storage(self):
+        '''test sqlite storage and migrations from and to csv'''
+        lines = [
+            '2019-01-01,legacy +tag,1:00,2019-01-01 10:00,2019-01-01 11:00\n',
+            '2019-01-02,new @home,2019-01-02 10:00,2019-01-02 11:30\n',
+            '2019-01-03,legacy +tag,2019-01-03 10:00,2019-01-03 10:30\n',
+        ]
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.writelines(lines)
+        expected = [(task.tid, task.name, task.work_time) for task in get_tasks()]
+
+        self.assertTrue(migrate('sqlite'))
+        try:
+            self.assertEqual(get_storage().NAME, 'sqlite')
+            real = [(task.tid, task.name, task.work_time) for task in get_tasks()]
+            self.assertEqual(real, expected)
+
+            real = get_tasks(since=datetime(2019, 1, 2), until=datetime(2019, 1, 3))
+            self.assertEqual([task.name for task in real], ['new @home'])
+            real = get_tasks(tag='+ta')
+            self.assertEqual([task.tid for task in real], [1, 1])
+            self.assertEqual([get_storage().name(tid) for tid in (0, 2, 3)],
+                             [None, 'new @home', None])
+            real = get_task_totals(text='new', exact=True)
+            self.assertEqual([(task.tid, task.work_time) for task in real],
+                             [(2, timedelta(minutes=90))])
+
+            os.remove(self.conf.data_fullpath)
+            self.assertTrue(migrate('csv'))
+            self.assertEqual(open(self.conf.data_fullpath).readlines(), lines)
+        finally:
+            get_configuration().storage = 'csv'
+
+    def test_daily_rollup(self):
+        '''test weekly and longer totals are summed from the daily rollups'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,- a +x,1:00,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-01,b,2019-01-01 11:00,2019-01-01 11:20\n')
+            fdata.write('2019-01-02,a +x,2019-01-02 10:00,2019-01-02 10:30\n')
+            fdata.write('2019-02-01,b,2019-02-01 10:00,2019-02-01 10:05\n')
+
+        def totals(tasks):
+            return [(task.tid, task.name, task.end_time, task.work_time) for task in tasks]
+
+        expected = totals(group_task_by(get_tasks(), 'name'))
+        self.assertEqual(totals(get_task_totals(exact=True)), expected)
+        self.assertTrue(os.path.exists(self.conf.data_fullpath + '.rollup'))
+
+        selection = dict(since=datetime(2019, 1, 1), until=datetime(2019, 2, 1))
+        self.assertEqual(totals(get_task_totals(exact=True, **selection)),
+                         [(2, 'a +x', datetime(2019, 1, 2, 10, 30), timedelta(minutes=90)),
+                          (1, 'b', datetime(2019, 1, 1, 11, 20), timedelta(minutes=20))])
+        daily = [(task.last_end_date, task.tid, task.work_time)
+                 for task in get_task_totals(exact=True, daily=True, **selection)]
+        self.assertEqual(daily, [('2019-01-02', 2, timedelta(minutes=30)),
+                                 ('2019-01-01', 1, timedelta(minutes=20)),
+                                 ('2019-01-01', 2, timedelta(hours=1))])
+        self.assertEqual(totals(get_task_totals(tag='+x', exact=True)),
+                         totals(get_task_totals(text='a', exact=True)))
+        self.assertEqual([task.tid for task in get_task_totals(text='02-01', exact=True)], [1])
+
+        Task('a +x', start_str='2019-02-01 11:00').start()
+        Task.stop('2019-02-01 12:00')
+        expected = totals(group_task_by(get_tasks(), 'name'))
+        self.assertEqual(totals(get_task_totals(exact=True)), expected)
+        self.assertEqual(expected[0][3], timedelta(minutes=150))
+
+        get_storage().rebuild()
+        self.assertEqual(totals(get_task_totals(exact=True)), expected)
+
+    def test_compile_query(self):
+        '''test queries are compiled into ranges, tags and texts'''
+        plan = compile_query('from 2019-03-01 to 2019-04-15', limit=10)
+        self.assertEqual((plan.title, plan.since, plan.until, plan.limit),
+                         ('from 2019-03-01 to 2019-04-15',
+                          datetime(2019, 3, 1), datetime(2019, 4, 16), 10))
+        plan = compile_query('2019-02')
+        self.assertEqual((plan.since, plan.until), (datetime(2019, 2, 1), datetime(2019, 3, 1)))
+        self.assertEqual(compile_query('+tag').selection,
+                         dict(since=None, until=None, tag='+tag', text=None))
+        self.assertEqual(compile_query('2019-13').text, '2019-13')
+
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-02-28,a +tag,2019-02-28 10:00,2019-02-28 11:00\n')
+            fdata.write('2019-03-01,b,2019-03-01 10:00,2019-03-01 11:00\n')
+            fdata.write('2019-04-15,c 2019-02,2019-04-15 23:00,2019-04-15 23:59\n')
+            fdata.write('2019-04-16,d,2019-04-16 10:00,2019-04-16 11:00\n')
+
+        def names(query):
+            plan = compile_query(query)
+            return [task.name for task in get_tasks(plan.matches, **plan.selection)]
+
+        self.assertEqual(names('from 2019-03-01 to 2019-04-15'), ['c 2019-02', 'b'])
+        self.assertEqual(names('2019-02'), ['a +tag'])
+        self.assertEqual(names('+ta'), ['a +tag'])
+        self.assertEqual(names('2019-02-2'), ['a +tag'])
+
+    def test_import_timesheet(self):
+        '''test timesheets are merged in history in time order'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2019-01-01,a,2019-01-01 10:00,2019-01-01 11:00\n')
+            fdata.write('2019-01-05,b,2019-01-05 10:00,2019-01-05 11:00\n')
+        get_tasks()
+        timesheet = self.conf.data_fullpath + '.csv'
+        with open(timesheet, 'w') as fsheet:
+            fsheet.write('Date,Name,Start,Stop,Notes\n')
+            fsheet.write('2019-01-04,"c, +new",09:00,09:30,x\n')
+            fsheet.write('2019-01-03,a,2019-01-03 10:00,2019-01-03 10:15,\n')
+
+        get_storage().merge(read_timesheet(timesheet))
+        self.assertEqual([line.split(',')[1] for line in open(self.conf.data_fullpath)],
+                         ['a', 'a', 'c  +new', 'b'])
+        self.assertEqual([(task.tid, task.name) for task in get_tasks(tag='+new')],
+                         [(2, 'c  +new')])
+        self.assertEqual(TaskTable.load(self.conf.data_fullpath).signature,
+                         DayIndex.load(self.conf.data_fullpath).signature)
+
+        timesheet = self.conf.data_fullpath + '.ndjson'
+        with open(timesheet, 'w') as fsheet:
+            fsheet.write('{"name": "d", "start": "2019-01-06 10:00", '
+                         '"stop": "2019-01-06 12:00"}\n')
+        get_storage().merge(read_timesheet(timesheet))
+        self.assertEqual([(task.tid, task.work_time) for task in get_task_totals(exact=True)],
+                         [(1, timedelta(hours=2)), (2, timedelta(hours=1)),
+                          (3, timedelta(minutes=30)), (4, timedelta(minutes=75))])
+
+        with open(timesheet, 'a') as fsheet:
+            fsheet.write('{"name": "e", "start": "2019-01-06 10:00", "stop": "2019-01-05"}\n')
+        with self.assertRaisesRegex(ValueError, 'line 2: stop time'):
+            read_timesheet(timesheet)
+
+        with open(timesheet, 'w') as fsheet:
+            fsheet.write('{"date": "2019-01-04", "name": "g", "start": "9:00", "stop": "9:30"}\n')
+        self.assertEqual(read_timesheet(timesheet),
+                         [['2019-01-04', 'g', '2019-01-04 09:00', '2019-01-04 09:30']])
+        for start, stop in (('"date": "2019-01-04", "start": "9:00"', '"stop": "2019-01-04"'),
+                            ('"start": "10:00"', '"stop": "2019-01-04 11:00"'),
+                            ('"start": "last monday"', '"stop": "2019-01-04 11:00"'),
+                            ('"date": "2019-01-04", "start": "25:00"', '"stop": "11:00"')):
+            with open(timesheet, 'w') as fsheet:
+                fsheet.write('\n{"name": "g", %s, %s}\n' % (start, stop))
+            with self.assertRaisesRegex(ValueError, 'line 2: (start|stop) time .* is not'):
+                read_timesheet(timesheet)
+
+        self.assertTrue(migrate('sqlite'))
+        try:
+            get_storage().merge([['2019-01-02', 'f', '2019-01-02 10:00', '2019-01-02 11:00']])
+            self.assertEqual([task.name for task in get_tasks()],
+                             ['d', 'b', 'c  +new', 'a', 'f', 'a'])
+        finally:
+            get_configuration().storage = 'csv'
+
+    def test_segmented_storage(self):
+        '''test history split in yearly files, with the past ones sealed'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2018-12-30,a +old,1:00,2018-12-30 10:00,2018-12-30 11:00\n')
+            fdata.write('2018-12-31,b,2018-12-31 23:00,2019-01-01 00:00\n')
+            fdata.write('2019-01-02,a +old,2019-01-02 10:00,2019-01-02 10:30\n')
+            fdata.write('2019-01-03,c +new,2019-01-03 10:00,2019-01-03 10:15\n')
+
+        def totals(tasks):
+            return [(task.tid, task.name, task.end_time, task.work_time) for task in tasks]
+
+        expected = [(task.tid, task.name) for task in get_tasks()]
+        expected_totals = totals(get_task_totals(exact=True))
+
+        get_configuration().storage = 'segments'
+        try:
+            # The history is split on first use
+            self.assertEqual([(task.tid, task.name) for task in get_tasks()], expected)
+            segments = self.conf.data_fullpath + '.d'
+            self.assertEqual(sorted(glob(os.path.join(segments, '*.csv'))),
+                             [os.path.join(segments, '2018.csv'),
+                              os.path.join(segments, '2019.csv')])
+            self.assertEqual(len(open(os.path.join(segments, '2019.csv')).readlines()), 3)
+
+            self.assertEqual(totals(get_task_totals(exact=True)), expected_totals)
+            self.assertTrue(os.path.exists(os.path.join(segments, '2018.csv.seal')))
+            self.assertFalse(os.path.exists(os.path.join(segments, '2019.csv.seal')))
+            self.assertTrue(Seal.load(os.path.join(segments, '2018.csv')).has_tag('+ol'))
+
+            self.assertEqual([task.tid for task in get_tasks(tag='+new')], [1])
+            self.assertEqual([task.name for task in get_tasks(since=datetime(2019, 1, 2))],
+                             ['c +new', 'a +old'])
+            self.assertEqual([get_storage().name(tid) for tid in (0, 3, 4)], [None, 'b', None])
+
+            Task('b', start_str='2019-01-04 10:00').start().stop('2019-01-04 10:10')
+            self.assertEqual([(task.tid, task.work_time)
+                              for task in get_task_totals(text='b', exact=True)],
+                             [(1, timedelta(minutes=70))])
+        finally:
+            get_configuration().storage = 'csv'
+
+    def test_archive_segments(self):
+        '''test past yearly files are compressed and still read'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            fdata.write('2017-05-01,a +old,2017-05-01 10:00,2017-05-01 11:00\n')
+            fdata.write('2018-05-01,b,2018-05-01 10:00,2018-05-01 10:30\n')
+            fdata.write('2019-05-01,a +old,2019-05-01 10:00,2019-05-01 10:15\n')
+        expected = [(task.tid, task.name, task.work_time) for task in get_tasks()]
+
+        get_configuration().storage = 'segments'
+        try:
+            segments = self.conf.data_fullpath + '.d'
+            self.assertEqual(get_storage().archive(),
+                             [os.path.join(segments, '2017.csv.xz'),
+                              os.path.join(segments, '2018.csv.xz')])
+            self.assertEqual(sorted(glob(os.path.join(segments, '*.csv')) +
+                                    glob(os.path.join(segments, '*.csv.xz'))),
+                             [os.path.join(segments, '2017.csv.xz'),
+                              os.path.join(segments, '2018.csv.xz'),
+                              os.path.join(segments, '2019.csv')])
+            self.assertEqual(get_storage().archive(), [])
+            self.assertEqual([(task.tid, task.name, task.work_time) for task in get_tasks()],
+                             expected)
+            self.assertEqual([(task.tid, task.work_time)
+                              for task in get_task_totals(tag='+old', exact=True)],
+                             [(1, timedelta(minutes=75))])
+
+            # Archives compressed by hand are read as well
+            path = os.path.join(segments, '2018.csv')
+            with lzma.open(path + '.xz') as archive, gzip.open(path + '.gz', 'wb') as cfile:
+                cfile.write(archive.read())
+            os.remove(path + '.xz')
+            self.assertEqual([task.name for task in get_tasks(until=datetime(2019, 1, 1))],
+                             ['b', 'a +old'])
+            with gzip.open(path + '.gz') as cfile:
+                lines = cfile.read().decode().splitlines()
+            for needles in ((), (b'b',)):
+                self.assertEqual(list(reverse_lines(path + '.gz', block_size=7, needles=needles)),
+                                 [line for line in reversed(lines)
+                                  if all(needle.decode() in line for needle in needles)])
+            self.assertEqual(list(reverse_lines(path + '.gz', end=len(lines[0]) + 1,
+                                                block_size=7)),
+                             lines[:1])
+
+            get_storage().merge([['2017-05-02', 'c', '2017-05-02 10:00', '2017-05-02 11:00']])
+            self.assertFalse(os.path.exists(os.path.join(segments, '2017.csv.xz')))
+            self.assertEqual(len(open(os.path.join(segments, '2017.csv')).readlines()), 2)
+
+            # Corrupted archives are storage errors
+            with open(path + '.gz', 'r+b') as cfile:
+                cfile.seek(20)
+                cfile.write(b'\0' * 20)
+            self.assertEqual(get_tasks(until=datetime(2019, 1, 1)), [])
+        finally:
+            get_configuration().storage = 'csv'
+
+    def test_parallel_task_totals(self):
+        '''test history parsed by worker processes gives the same totals'''
+        with open(self.conf.data_fullpath, 'w') as fdata:
+            for i in range(12000):
+                day = datetime(2019, 1, 1) + timedelta(hours=i)
+                fdata.write('%s,task %d +t%d,%s,%s\n' % (
+                    day.strftime('%Y-%m-%d'), i % 7, i % 3, day.strftime('%Y-%m-%d %H:%M'),
+                    (day + timedelta(minutes=i % 50)).strftime('%Y-%m-%d %H:%M')))
+        size = os.path.getsize(self.conf.data_fullpath)
+        chunks = split_ranges(self.conf.data_fullpath, [(0, size)], 3)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual([chunk[1] for chunk in chunks[1:]] + [size],
+                         [chunk[0] for chunk in chunks[:-1]] + [chunks[0][1]])
+        data = open(self.conf.data_fullpath, 'rb').read()
+        self.assertTrue(all(data[start - 1:start] == b'\n' for start, _ in chunks[:-1]))
+
+        def totals(**selection):
+            return [(task.tid, task.name, task.end_time, task.work_time, task.count)
+                    for task in get_task_totals(**selection)]
+
+        selections = [{}, dict(daily=True), dict(tag='+t1'), dict(text='task 3')]
+        expected = [totals(**selection) for selection in selections]
+        os.environ['LETSDO_WORKERS'] = '3'
+        try:
+            self.assertEqual([totals(**selection) for selection in selections], expected)
+        finally:
+            del os.environ['LETSDO_WORKERS']
+
+    def test_parse_history_datetime(self):
+        '''test parse_history_datetime'''
+        self.assertEqual(parse_history_datetime('2016-11-10 19:02'),
+                         datetime(2016, 11, 10, 19, 2))
+        self.assertEqual(parse_history_datetime('2016/11/10 19:02'),
+                         datetime(2016, 11, 10, 19, 2))
+
+    def test_load_flat(self):
+        '''test load_flat reads configurations as yaml does, or leaves them to it'''
+        import yaml
+        for text in ('COLOR_ENABLED: true\nDATA_DIRECTORY: ~/\n',
+                     'COLOR_ENABLED: False\nDATA_DIRECTORY: /tmp/my-data.d\nSTORAGE: sqlite\n',
+                     '\nDATA_DIRECTORY: /tmp\n\n'):
+            self.assertEqual(load_flat(text), yaml.safe_load(text))
+        for text in ('COLOR_ENABLED: yes\n', 'DATA_DIRECTORY: ~\n', 'STORAGE: 1\n',
+                     'DATA_DIRECTORY: "/tmp"\n', '# comment\nSTORAGE: csv\n'):
+            self.assertIsNone(load_flat(text))
+
+    def test_paint_cache(self):
+        '''test painted messages are cached and equal to the painter output'''
+        self.assertEqual(_p(' 1h 05m 12%'), ' 1h 05m 12%')
+        if not painter():
+            return
+        get_configuration().color_enabled = True
+        try:
+            hits = _paint.cache_info().hits
+            self.assertEqual(_p(3), painter().paint('3'))
+            self.assertEqual(_p(' 1h 05m 12%'), painter().paint(' 1h 05m 12%'))
+            self.assertEqual(_p(' 1h 05m 12%'), painter().paint(' 1h 05m 12%'))
+            self.assertEqual(_p(''), '')
+            self.assertEqual(_paint.cache_info().hits, hits + 1)
+        finally:
+            get_configuration().color_enabled = False
+
+    def test_streaming_table(self):
+        '''test StreamingTable prints tables as terminaltables, wrapping late wide cells'''
+        from terminaltables import AsciiTable
+        heading = ['ID', 'Description']
+        rows = [[1, 'short'], [2, 'a bit longer\n ⤷ name'], [3, 'a much longer task name']]
+        footer = [3, 'total']
+
+        table = AsciiTable([heading] + rows + [footer], ' title ')
+        table.inner_footing_row_border = True
+        lines = list(StreamingTable(table, heading, footer).lines(rows))
+        self.assertEqual('\n'.join(lines), table.table)
+
+        lines = list(StreamingTable(table, heading, footer, sample=2).lines(rows))
+        self.assertEqual(len(set(len(line) for line in lines)), 1)
+        self.assertEqual(lines[6:9], [
+            '| 3  | a much       |', '|    |  longer task |', '|    |  name        |'])
+
+    def test_startup_imports(self):
+        '''test that commands do not import the modules they do not use'''
+        src = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+        script = (
+            'import sys\n'
+            'import letsdo\n'
+            'modules = sys.argv[1].split()\n'
+            'sys.argv = ["lets"] + sys.argv[2:]\n'
+            'letsdo.main()\n'
+            'print(" ".join(m for m in modules if m in sys.modules))\n')
+
+        def imported(*args):
+            modules = 'yaml parsedatetime raffaello terminaltables logging hashlib pickle lzma gzip'
+            output = subprocess.check_output(
+                [sys.executable, '-c', script, modules] + list(args), cwd=src)
+            return output.decode().splitlines()[-1].split()
+
+        self.assertEqual(imported('do', 'startup', '--time=10:00'), [])
+        self.assertEqual(imported('stop', '10:30'), [])
+        self.assertEqual(imported('see'), ['terminaltables', 'hashlib'])
+
+    def test_profile_phases(self):
+        '''test LETSDO_PROFILE reports the time of each phase of a command'''
+        Task('profiled task', start_str='10:00').start()
+        Task.stop('10:30')
+
+        src = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+        report = self.conf.data_fullpath + '.profile'
+        env = dict(os.environ, LETSDO_PROFILE=report)
+        subprocess.check_output(
+            [sys.executable, '-c', 'import letsdo; letsdo.main()',
+             'see', 'today', '--day-by-day'],
+            cwd=src, env=env)
+
+        lines = open(report).read().splitlines()
+        self.assertTrue(lines[0].startswith('letsdo profile:'))
+        phases = [line.split()[0] for line in lines[1:]]
+        self.assertEqual(phases[0], 'config')
+        for name in ('history', 'parse', 'filter', 'group', 'render', 'total'):
+            self.assertIn(name, phases)
+
     def test_continue_task_by_index(self):
         '''test continue_task_by_index'''
         for i in range(3):